@@ -0,0 +1,101 @@
+# bathtub model: inflow fills the container, outflow drains it
+from qr_model import Model, NZP, ZP, ZPM
+
+
+def bathtubModel():
+    model = Model('bathtub')
+    addBathtub(model, 'inflow', 'volume', 'outflow')
+    return model
+
+
+# adds quantities, relations and rules of one container, with exogenous=False
+# the inflow is not changed from outside and has to be driven by relations
+def addBathtub(model, inflow, volume, outflow, exogenous=True):
+    IM = (inflow, 'mag')
+    ID = (inflow, 'der')
+    OM = (outflow, 'mag')
+    OD = (outflow, 'der')
+    model.addQuantity(inflow, ZP(), NZP())
+    model.addQuantity(volume, ZPM(), NZP())
+    model.addQuantity(outflow, ZPM(), NZP())
+
+    model.addInfluence(inflow, volume, 1)
+    model.addInfluence(outflow, volume, -1)
+    # changes of volume are mirrored by the outflow
+    model.addProportionality(volume, outflow, 1)
+    model.addCorrespondence(volume, outflow)
+
+    # imidiate changes
+    model.addRule("Im+->Vd+,Od+", [(OM, '==', 0), (OD, '==', 1)],
+                  [(volume, 'mag', 1)], kind='immediate')
+    model.addRule("Id+->Im+. Im+->Vd+,Od+",
+                  [(IM, '==', 0), (ID, '==', 1), (OD, 'stationary', True)],
+                  [(inflow, 'mag', 1), (volume, 'der', 1)], kind='immediate',
+                  note="Positive change in inflow increases magnitude of inflow."
+                  " Positive change in inflow magnitude causes to positively increase"
+                  " change of volume and outflow.")
+    model.addRule("Id+->Im+. Im+->Vd+,Od+",
+                  [(IM, '==', 0), (ID, '==', 1), (OD, 'stationary', False)],
+                  [(inflow, 'mag', 1)], kind='immediate',
+                  note="Positive change in inflow increases magnitude of inflow.")
+
+    # inflow is changed from outside when nothing happens immediately
+    if exogenous:
+        model.addRule("Id+", [(ID, '==', 0)],
+                      [(inflow, 'der', 1)], transition="increase", kind='exogenous')
+        model.addRule("Id-", [(ID, '==', 0), (IM, '!=', 0)],
+                      [(inflow, 'der', -1)], transition="decrease", kind='exogenous')
+        model.addRule("Id+", [(ID, '==', -1), (OM, '!=', 2), (IM, '==', 0)],
+                      [(inflow, 'der', 1)], transition="increase", kind='exogenous')
+        model.addRule("Id+", [(ID, '==', -1), (OM, '!=', 2), (IM, '==', 1), (OD, '!=', 0)],
+                      [(inflow, 'der', 1)], transition="increase", kind='exogenous')
+        model.addRule("Id-", [(ID, '==', 1), (IM, '==', 1), (OD, '!=', 0)],
+                      [(inflow, 'der', -1)], transition="decrease", kind='exogenous')
+        model.addRule("Id-", [(ID, '==', 1), (IM, '==', 1), (OD, '==', 0), (OM, '==', 2)],
+                      [(inflow, 'der', -1)], transition="decrease", kind='exogenous')
+
+    # increasing inflow volume
+    increasing = [(IM, '==', 1), (ID, '==', 1)]
+    model.addRule("E+->Vd+,Od+", increasing + [(OM, '!=', 2)],
+                  [(volume, 'der', 1)],
+                  note="Increasing inflow. Increasing derivation of Volume and Outflow.")
+    model.addRule("E+->Om+", increasing + [(OM, '==', 1), (OD, '==', 1)],
+                  [(volume, 'mag', 1), (volume, 'der', -1)],
+                  note="Increasing inflow. Maximal capacity of container reached.")
+    # rate of changes between inflow and outflow- outflow is faster -> go back to steady
+    model.addRule("Im<Om->Vd-,Od-", increasing + [(OM, '==', 1), (OD, '==', ID)],
+                  [(volume, 'der', -1)],
+                  note="Increasing inflow. Inflow is increasing slower than Outflow."
+                  " The volume is in positive steady state.")
+
+    # steady inflow volume
+    steady = [(IM, '==', 1), (ID, '==', 0)]
+    for der, sign in [(1, '-'), (0, '~'), (-1, '+')]:
+        model.addRule("E~->Vd" + sign + ",Od" + sign, steady + [(OD, '==', der)],
+                      [(volume, 'der', -der)], transition="",
+                      note="Positive steady inflow.")
+    model.addRule("E~->Vm+,Om+", steady + [(OD, '==', 1)],
+                  [(volume, 'mag', 1), (volume, 'der', -1)],
+                  note="Positive steady inflow. Maximal capacity of container reached.")
+
+    # decreasing inflow volume
+    decreasing = [(IM, '==', 1), (ID, '==', -1)]
+    model.addRule("E-->Vd-,Od-", decreasing, [(volume, 'der', -1)])
+    # extreme no inflow volume left
+    model.addRule("E-->Id0,Im0", decreasing + [(OD, '==', -1), (OM, '<', 2)],
+                  [(inflow, 'der', 1), (inflow, 'mag', -1)],
+                  note="Inflow is empty.")
+    # colapsing from maximum to plus
+    model.addRule("E-->Vm-,Om-", decreasing + [(OM, '==', 2), (OD, '==', -1)],
+                  [(volume, 'mag', -1)],
+                  note="Inflow is is slowing down what causes increase in outflow rate.")
+    # speed of decrease can be different in inflow and outflow -> go to steady outflow
+    model.addRule("E-->Vd-,Od-", decreasing + [(OD, '==', ID), (OM, 'stationary', False)],
+                  [(volume, 'der', 1)],
+                  note="Positive steady state")
+
+    # no inflow volume
+    closed = [(IM, '==', 0), (ID, '==', 0)]
+    model.addRule("E0->Vd-,Od-", closed + [(OM, '>', 0)], [(volume, 'der', -1)])
+    model.addRule("E0->Vd+,Od+", closed + [(OM, '==', 1), (OD, '==', -1)],
+                  [(volume, 'der', 1), (volume, 'mag', -1)])
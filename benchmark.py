@@ -0,0 +1,263 @@
+# benchmarks of envisionment on families of synthetic models, results of
+# every phase are written to a JSON file so that versions can be compared
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from bathtub import addBathtub
+from qr_model import Model
+from state_graph import explore
+
+
+# k containers with their own inflow, the behaviours interleave
+def parallelTanksModel(k):
+    model = Model('parallel-%d' % k)
+    for idx in range(k):
+        addBathtub(model, 'inflow%d' % idx, 'volume%d' % idx, 'outflow%d' % idx)
+    return model
+
+
+# k containers where the outflow of a container is the inflow of the next
+def chainedTanksModel(k):
+    model = Model('chained-%d' % k)
+    for idx in range(k):
+        addBathtub(model, 'inflow%d' % idx, 'volume%d' % idx, 'outflow%d' % idx,
+                   exogenous=idx == 0)
+        if idx > 0:
+            model.addProportionality('outflow%d' % (idx - 1), 'inflow%d' % idx, 1)
+    return model
+
+
+FAMILIES = {
+    'parallel': parallelTanksModel,
+    'chained': chainedTanksModel,
+}
+
+
+def measure(function, memory):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def record(phase, elapsed, peak, num_states, num_edges):
+    return {'phase': phase, 'time': elapsed, 'peak_memory': peak,
+            'states': num_states, 'edges': num_edges,
+            'states_per_sec': num_states / elapsed if elapsed > 0 else None,
+            'edges_per_sec': num_edges / elapsed if elapsed > 0 else None}
+
+
+# successor generation, dedup, graph building and export measured separately
+def benchmarkPhases(model, memory):
+    import state_graph
+    from graph_writer import DotWriter, JsonlWriter, writeGraph
+
+    states, edges = state_graph.envision(model.zeroState(), model.compile())
+    values = [state.values for state in states]
+    results = []
+
+    def successors():
+        table = model.compile()
+        return [table.successors(val) for val in values]
+    generated, elapsed, peak = measure(successors, memory)
+    results.append(record('successors', elapsed, peak, len(states), len(edges)))
+
+    def dedup():
+        index = {}
+        for succ in generated:
+            for new_values, rule in succ:
+                if new_values not in index:
+                    index[new_values] = len(index)
+        return index
+    _, elapsed, peak = measure(dedup, memory)
+    results.append(record('dedup', elapsed, peak, len(states), len(edges)))
+
+    try:
+        import pydot  # noqa: F401
+    except ImportError:
+        pydot = None
+    if pydot is not None:
+        _, elapsed, peak = measure(lambda: state_graph.generateGraph(edges), memory)
+        results.append(record('graph', elapsed, peak, len(states), len(edges)))
+
+    def export():
+        writeGraph(states, edges, [DotWriter(io.StringIO()), JsonlWriter(io.StringIO())])
+    _, elapsed, peak = measure(export, memory)
+    results.append(record('export', elapsed, peak, len(states), len(edges)))
+    return results
+
+
+def benchmarkEngines(model, engines, workers, memory):
+    results = []
+    for engine in engines:
+        (states, edges), elapsed, peak = measure(
+            lambda: explore(model, engine=engine, workers=workers), memory)
+        results.append(record('envision-' + engine, elapsed, peak, len(states), len(edges)))
+    return results
+
+
+# names, values, descriptions and edges of the graph in a comparable form
+def graphSignature(states, edges):
+    return ([(state.name, state.values, state.desc, [succ.name for succ in state.next_states])
+             for state in states],
+            [(edge['source'].name, edge['target'].name, edge['explanation'], edge['transition'])
+             for edge in edges])
+
+
+# regression check that every engine gives the graph of the bfs engine,
+# returns the list of (model name, engine) which differ
+def checkEngines(families, sizes, engines, workers=None):
+    failed = []
+    for family in families:
+        for size in sizes:
+            model = FAMILIES[family](size)
+            expected = graphSignature(*explore(model, engine='bfs'))
+            for engine in engines:
+                result = graphSignature(*explore(model, engine=engine, workers=workers))
+                status = 'ok' if result == expected else 'DIFFERS'
+                if result != expected:
+                    failed.append((model.name, engine))
+                print("{:<14} {:<9} {}".format(model.name, engine, status))
+    return failed
+
+
+# qualitative problems of a graph explored with derived rules: magnitudes at
+# an extreme point with a derivative pointing past it
+def derivedProblems(model, states):
+    problems = []
+    for state in states:
+        for quantity, part in model.quantities:
+            if part != 'mag':
+                continue
+            q_model = model.model(quantity, 'mag')
+            mag = state.values[state.space.position[(quantity, 'mag')]]
+            der = state.space.models[state.space.position[(quantity, 'der')]].vals[
+                state.values[state.space.position[(quantity, 'der')]]]
+            if ((mag == 0 and q_model.stationary[0] and der < 0)
+                    or (mag == len(q_model.vals) - 1 and q_model.stationary[-1] and der > 0)):
+                problems.append("state %s: %s points past an extreme point"
+                                % (state.name, quantity))
+    return problems
+
+
+# regression check of the rules derived for the Garp3 bathtub: the tub fills
+# up to an equilibrium where inflow and outflow balance, and quantities which
+# correspond through pressure do not give parallel edges
+def checkDerivedRules(path):
+    from hgp_loader import loadModel
+    failed = []
+    for fragment, scenario in [('Bathtub model', 'Sink overflow'),
+                               ('Bathtub model presure', 'Sink overflow pressure')]:
+        model, initial_state = loadModel(path, fragment, scenario)
+        states, edges = explore(model, initial_state)
+        problems = derivedProblems(model, states)
+        if not any(state.getName('inflow', 'mag') == '+'
+                   and state.getName('outflow', 'mag') == '+'
+                   and state.getName('volume', 'der') == '0' for state in states):
+            problems.append("no steady state with inflow and outflow")
+        pairs = [(edge['source'].name, edge['target'].name) for edge in edges]
+        if len(set(pairs)) != len(pairs):
+            problems.append("%d parallel edges" % (len(pairs) - len(set(pairs))))
+        print("{:<22} {}".format(fragment, 'FAILS' if problems else 'ok'))
+        for problem in problems:
+            print("  " + problem)
+            failed.append((fragment, problem))
+    return failed
+
+
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(name for name in ('pydot', 'numpy', 'transitions') if name in sys.modules))
+"""
+
+
+# cold start import time of the library modules in a fresh interpreter and
+# heavy optional dependencies which were imported with them
+def importTimes(modules=('state_graph', 'sink_transitions')):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_PROBE.format(module=module)], cwd=directory)
+        lines = output.decode().splitlines() + ['']
+        results.append({'module': module, 'time': float(lines[0]),
+                        'heavy_imports': [name for name in lines[1].split(',') if name]})
+    return results
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(families, sizes, engines, workers=None, memory=True):
+    report = {'revision': gitRevision(), 'python': platform.python_version(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': [],
+              'imports': importTimes()}
+    for res in report['imports']:
+        print("import {:<16}{:>10.4f}s {}".format(res['module'], res['time'],
+                                                   ','.join(res['heavy_imports'])))
+    for family in families:
+        for size in sizes:
+            model = FAMILIES[family](size)
+            results = benchmarkPhases(model, memory)
+            results += benchmarkEngines(model, engines, workers, memory)
+            report['runs'].append({'family': family, 'size': size, 'results': results})
+            for res in results:
+                print("{:<9}{:>3} {:<24}{:>10.4f}s {:>8} states {:>8} edges".format(
+                    family, size, res['phase'], res['time'], res['states'], res['edges']))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark envisionment of synthetic models.")
+    parser.add_argument('--family', nargs='+', default=sorted(FAMILIES), choices=sorted(FAMILIES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 2, 3])
+    parser.add_argument('--engines', nargs='+', default=['bfs', 'vector', 'parallel'],
+                        choices=['bfs', 'vector', 'parallel'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip tracemalloc, timings are not slowed down by tracing")
+    parser.add_argument('--check', action='store_true',
+                        help="only check that all engines give the same graph")
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failed = checkEngines(args.family, args.sizes, args.engines, args.workers)
+        hgp_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Bathtub.hgp')
+        if os.path.exists(hgp_path):
+            failed += checkDerivedRules(hgp_path)
+        if failed:
+            sys.exit(1)
+        return
+
+    report = runBenchmarks(args.family, args.sizes, args.engines, args.workers,
+                           memory=not args.no_memory)
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# compact CSR adjacency of the state graph with numpy analytics, edges are
+# stored as index arrays and never as python objects
+import numpy as np
+
+from graph_index import stronglyConnected
+
+# small integer codes of edge types
+EDGE_TYPES = ['time', 'increase', 'decrease', '']
+
+
+class CsrGraph(object):
+    def __init__(self, indptr, indices, edge_type, edge_desc, descs, values=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_type = edge_type
+        self.edge_desc = edge_desc
+        self.descs = descs
+        self.values = values
+        self.num_states = len(indptr) - 1
+
+    # states and edges as returned by envision, states are numbered by position
+    @classmethod
+    def fromEdges(cls, states, edges):
+        number = {state.key(): idx for idx, state in enumerate(states)}
+        descs = sorted(set(edge['explanation'] for edge in edges))
+        desc_ids = {desc: idx for idx, desc in enumerate(descs)}
+        type_ids = {name: idx for idx, name in enumerate(EDGE_TYPES)}
+        source = np.fromiter((number[edge['source'].key()] for edge in edges),
+                             dtype=np.int32, count=len(edges))
+        target = np.fromiter((number[edge['target'].key()] for edge in edges),
+                             dtype=np.int32, count=len(edges))
+        edge_type = np.fromiter((type_ids[edge['transition']] for edge in edges),
+                                dtype=np.int8, count=len(edges))
+        edge_desc = np.fromiter((desc_ids[edge['explanation']] for edge in edges),
+                                dtype=np.int32, count=len(edges))
+        values = np.array([state.values for state in states], dtype=np.uint8)
+        return cls.fromArrays(len(states), source, target, edge_type, edge_desc, descs, values)
+
+    # transition matrix of vector_envision
+    @classmethod
+    def fromMatrix(cls, matrix):
+        type_ids = {name: idx for idx, name in enumerate(EDGE_TYPES)}
+        descs = sorted(set(rule.desc for rule in matrix.rules))
+        desc_ids = {desc: idx for idx, desc in enumerate(descs)}
+        rule_type = np.array([type_ids[rule.transition] for rule in matrix.rules], dtype=np.int8)
+        rule_desc = np.array([desc_ids[rule.desc] for rule in matrix.rules], dtype=np.int32)
+        values = matrix.product.decode(matrix.codes).astype(np.uint8)
+        return cls(matrix.indptr.astype(np.int32), matrix.indices.astype(np.int32),
+                   rule_type[matrix.rule], rule_desc[matrix.rule], descs, values)
+
+    @classmethod
+    def fromArrays(cls, num_states, source, target, edge_type, edge_desc, descs, values=None):
+        order = np.argsort(source, kind='stable')
+        indptr = np.zeros(num_states + 1, dtype=np.int32)
+        np.cumsum(np.bincount(source, minlength=num_states), out=indptr[1:])
+        return cls(indptr, target[order].astype(np.int32), edge_type[order],
+                   edge_desc[order], descs, values)
+
+    def sources(self):
+        return np.repeat(np.arange(self.num_states, dtype=np.int32), np.diff(self.indptr))
+
+    def outDegree(self):
+        return np.diff(self.indptr)
+
+    def inDegree(self):
+        return np.bincount(self.indices, minlength=self.num_states)
+
+    def terminal(self):
+        return np.flatnonzero(self.outDegree() == 0)
+
+    # repeatedly removes states without incoming edges, states which remain
+    # are on a cycle or reachable from one
+    def cyclic(self):
+        source = self.sources()
+        in_degree = self.inDegree()
+        alive = np.ones(self.num_states, dtype=bool)
+        while True:
+            removed = alive & (in_degree == 0)
+            if not removed.any():
+                return alive
+            alive &= ~removed
+            edges = removed[source]
+            in_degree -= np.bincount(self.indices[edges], minlength=self.num_states)
+
+    def hasCycle(self):
+        return bool(self.cyclic().any())
+
+    # strongly connected component of every state and the number of components,
+    # components are numbered in order of their first state; scipy is used
+    # when it is installed, otherwise tarjan on the rows
+    def components(self):
+        try:
+            from scipy.sparse import csgraph, csr_matrix
+        except ImportError:
+            rows = np.split(self.indices, self.indptr[1:-1])[:self.num_states]
+            component = np.array(stronglyConnected([row.tolist() for row in rows])[0],
+                                 dtype=np.int64)
+        else:
+            matrix = csr_matrix((np.ones(len(self.indices), dtype=np.int8), self.indices,
+                                 self.indptr), shape=(self.num_states, self.num_states))
+            component = csgraph.connected_components(matrix, directed=True,
+                                                     connection='strong')[1]
+        # labels are 0 to count - 1, first is the first state of every label
+        first = np.unique(component, return_index=True)[1]
+        number = np.empty(len(first), dtype=np.int32)
+        number[np.argsort(first)] = np.arange(len(first), dtype=np.int32)
+        return number[component], len(first)
+
+    # strongly connected components without edges leaving them, behaviour
+    # which enters such a set never leaves it
+    def absorbingSets(self):
+        component, num_components = self.components()
+        src = component[self.sources()]
+        tgt = component[self.indices]
+        leaving = np.zeros(num_components, dtype=bool)
+        leaving[src[src != tgt]] = True
+        order = np.argsort(component, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(component, minlength=num_components))[:-1])
+        return [groups[comp] for comp in np.flatnonzero(~leaving)]
+
+    def edgeCounts(self):
+        counts = np.bincount(self.edge_type, minlength=len(EDGE_TYPES))
+        return {name: int(count) for name, count in zip(EDGE_TYPES, counts)}
+
+    def save(self, path):
+        arrays = {'indptr': self.indptr, 'indices': self.indices, 'edge_type': self.edge_type,
+                  'edge_desc': self.edge_desc, 'descs': np.array(self.descs, dtype=str)}
+        if self.values is not None:
+            arrays['values'] = self.values
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        values = data['values'] if 'values' in data else None
+        return cls(data['indptr'], data['indices'], data['edge_type'], data['edge_desc'],
+                   data['descs'].tolist(), values)
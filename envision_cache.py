@@ -0,0 +1,200 @@
+# content addressed on disk cache of envisionments, a graph is stored under
+# the hash of the model definition and the initial state in a compact binary
+# file which is memory mapped when loaded
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from qr_model import State
+from state_graph import createEdge, envision
+
+MAGIC = b'KRQR'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+
+
+# canonical text of everything which influences the envisionment
+def modelFingerprint(model, initial_state):
+    definition = {
+        'version': VERSION,
+        'quantities': [list(q) for q in model.quantities],
+        'spaces': [[type(m).__name__, m.names, m.vals, m.stationary] for m in model.models],
+        'influences': [list(rel) for rel in model.influences],
+        'proportionalities': [list(rel) for rel in model.proportionalities],
+        'correspondences': [list(rel) for rel in model.correspondences],
+        'rules': [[rule.desc, [[list(ref), op, list(rhs) if isinstance(rhs, tuple) else rhs]
+                               for ref, op, rhs in rule.when],
+                   [list(ch) for ch in rule.changes], rule.transition, rule.note, rule.kind]
+                  for rule in model.rules],
+        'initial': [list(initial_state.values), initial_state.desc],
+    }
+    text = json.dumps(definition, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def padding(size):
+    return b'\0' * (-size % 4)
+
+
+def writeGraph(path, states, edges):
+    strings = []
+    string_ids = {}
+
+    def stringId(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    number = {state.key(): idx for idx, state in enumerate(states)}
+    state_desc = array.array('i', [stringId(state.desc) for state in states])
+    source = array.array('i', [number[edge['source'].key()] for edge in edges])
+    target = array.array('i', [number[edge['target'].key()] for edge in edges])
+    edge_desc = array.array('i', [stringId(edge['explanation']) for edge in edges])
+    transition = array.array('i', [stringId(edge['transition']) for edge in edges])
+    num_quantities = len(states[0].values)
+    values = array.array('B', [val for state in states for val in state.values])
+    blob = json.dumps(strings).encode('utf-8')
+
+    if sys.byteorder != 'little':
+        for arr in (state_desc, source, target, edge_desc, transition):
+            arr.byteswap()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, num_quantities, len(states), len(edges), len(blob)))
+        out.write(blob + padding(len(blob)))
+        for arr in (state_desc, source, target, edge_desc, transition, values):
+            out.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+
+class CachedGraph(object):
+    # arrays are views into the memory mapped file
+    def __init__(self, path):
+        with open(path, 'rb') as cache_file:
+            self.buffer = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.checkSize(path)
+        except (ValueError, struct.error):
+            self.buffer.close()
+            raise
+        magic, version, num_quantities, num_states, num_edges, blob_size = \
+            HEADER.unpack_from(self.buffer, 0)
+        view = memoryview(self.buffer)
+        offset = HEADER.size
+        self.strings = json.loads(bytes(view[offset:offset + blob_size]).decode('utf-8'))
+        offset += blob_size + len(padding(blob_size))
+        arrays = []
+        for size in (num_states, num_edges, num_edges, num_edges, num_edges):
+            arrays.append(view[offset:offset + 4 * size].cast('i'))
+            offset += 4 * size
+        self.state_desc, self.source, self.target, self.edge_desc, self.transition = arrays
+        self.values = view[offset:offset + num_states * num_quantities]
+        self.num_quantities = num_quantities
+        self.num_states = num_states
+        self.num_edges = num_edges
+
+    # a truncated or overlong file would give views past the data or garbage states
+    def checkSize(self, path):
+        if len(self.buffer) < HEADER.size:
+            raise ValueError("truncated envisionment cache file: " + path)
+        magic, version, num_quantities, num_states, num_edges, blob_size = \
+            HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not an envisionment cache file: " + path)
+        if sys.byteorder != 'little':
+            raise ValueError("cache files can be mapped only on little endian machines")
+        expected = (HEADER.size + blob_size + len(padding(blob_size))
+                    + 4 * (num_states + 4 * num_edges) + num_states * num_quantities)
+        if len(self.buffer) != expected:
+            raise ValueError("envisionment cache file has %d bytes instead of %d: %s"
+                             % (len(self.buffer), expected, path))
+
+    def stateValues(self, idx):
+        start = idx * self.num_quantities
+        return tuple(self.values[start:start + self.num_quantities])
+
+    # same states and edges as returned by envision
+    def toStates(self, space):
+        states = []
+        for idx in range(self.num_states):
+            state = State(space, self.stateValues(idx))
+            state.name = str(idx)
+            state.desc = self.strings[self.state_desc[idx]]
+            states.append(state)
+        edges = []
+        for idx in range(self.num_edges):
+            source, target = states[self.source[idx]], states[self.target[idx]]
+            source.next_states.append(target)
+            edges.append(createEdge(source, target, self.strings[self.edge_desc[idx]],
+                                    self.strings[self.transition[idx]]))
+        return states, edges
+
+    def close(self):
+        self.values.release()
+        for arr in (self.state_desc, self.source, self.target, self.edge_desc, self.transition):
+            arr.release()
+        self.buffer.close()
+
+
+class EnvisionCache(object):
+    # least recently used files are removed when the directory grows over max_bytes
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.krqr')
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            graph = CachedGraph(path)
+        except (OSError, ValueError, struct.error):
+            return None
+        os.utime(path)
+        return graph
+
+    def store(self, key, states, edges):
+        writeGraph(self.path(key), states, edges)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.krqr'):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and name == keep + '.krqr':
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    # returns states and edges from the cache or computes and stores them
+    def envision(self, model, initial_state, explore=None):
+        key = modelFingerprint(model, initial_state)
+        graph = self.load(key)
+        if graph is not None:
+            states, edges = graph.toStates(initial_state.space)
+            graph.close()
+            return states, edges
+        if explore is None:
+            states, edges = envision(initial_state, model.compile())
+        else:
+            states, edges = explore(initial_state, model)
+        self.store(key, states, edges)
+        return states, edges
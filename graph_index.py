@@ -0,0 +1,183 @@
+# query index over a computed state graph: strongly connected components,
+# their condensation in topological order and reachability bitsets
+import collections
+
+
+class GraphIndex(object):
+    # states is the list returned by envision, successors are taken from next_states
+    def __init__(self, states):
+        self.states = list(states)
+        self.number = {state.key(): idx for idx, state in enumerate(self.states)}
+        self.adjacency = [[self.number[target.key()] for target in state.next_states]
+                          for state in self.states]
+        self.terminal = [idx for idx, succ in enumerate(self.adjacency) if len(succ) == 0]
+        self.component, self.components = stronglyConnected(self.adjacency)
+        # tarjan returns components in reverse topological order
+        self.topological = list(range(len(self.components) - 1, -1, -1))
+        self.dag = [set() for _ in self.components]
+        for src, succ in enumerate(self.adjacency):
+            for tgt in succ:
+                if self.component[src] != self.component[tgt]:
+                    self.dag[self.component[src]].add(self.component[tgt])
+        # reach[c] has bit d set when component d is reachable from c
+        self.reach = [0] * len(self.components)
+        for comp in range(len(self.components)):
+            bits = 1 << comp
+            for succ in self.dag[comp]:
+                bits |= self.reach[succ]
+            self.reach[comp] = bits
+        self.terminal_mask = self.stateMask(lambda state: len(state.next_states) == 0)
+
+    def index(self, state):
+        return self.number[state.key()]
+
+    # bitset of components which contain a state satisfying the predicate
+    def stateMask(self, predicate):
+        mask = 0
+        for idx, state in enumerate(self.states):
+            if predicate(state):
+                mask |= 1 << self.component[idx]
+        return mask
+
+    def reachable(self, source, target):
+        return bool((self.reach[self.component[self.index(source)]]
+                     >> self.component[self.index(target)]) & 1)
+
+    # predicate may be a function of state or a mask from stateMask
+    def canReach(self, source, predicate):
+        mask = predicate if isinstance(predicate, int) else self.stateMask(predicate)
+        return bool(self.reach[self.component[self.index(source)]] & mask)
+
+    def reachableStates(self, source):
+        bits = self.reach[self.component[self.index(source)]]
+        return [state for idx, state in enumerate(self.states)
+                if (bits >> self.component[idx]) & 1]
+
+    def terminalStates(self, source=None):
+        if source is None:
+            return [self.states[idx] for idx in self.terminal]
+        bits = self.reach[self.component[self.index(source)]]
+        return [self.states[idx] for idx in self.terminal
+                if (bits >> self.component[idx]) & 1]
+
+    # breadth first search to the nearest state satisfying goal, which is
+    # either a state or a predicate; returns list of states or None
+    def shortestPath(self, source, goal):
+        if not callable(goal):
+            target = self.index(goal)
+            if not self.reachable(source, goal):
+                return None
+            goal_test = lambda idx: idx == target
+        else:
+            goal_test = lambda idx: goal(self.states[idx])
+        start = self.index(source)
+        parent = {start: None}
+        fringe = collections.deque([start])
+        while fringe:
+            curr = fringe.popleft()
+            if goal_test(curr):
+                path = []
+                while curr is not None:
+                    path.append(self.states[curr])
+                    curr = parent[curr]
+                return path[::-1]
+            for succ in self.adjacency[curr]:
+                if succ not in parent:
+                    parent[succ] = curr
+                    fringe.append(succ)
+        return None
+
+    # number of paths in the condensation from the component of source to
+    # components holding terminal states: every strongly connected component
+    # counts as one node and parallel edges between two components as one
+    # edge, so this is not the number of paths over states; computed in one
+    # pass over the components in reverse topological order
+    def countComponentPathsToTerminal(self, source):
+        terminal = set(self.component[idx] for idx in self.terminal)
+        counts = [0] * len(self.components)
+        for comp in range(len(self.components)):
+            counts[comp] = (1 if comp in terminal else 0) + sum(counts[s] for s in self.dag[comp])
+        return counts[self.component[self.index(source)]]
+
+    # simple paths from source to terminal states, at most limit of them
+    def pathsToTerminal(self, source, limit=None):
+        start = self.index(source)
+        if limit is not None and limit <= 0:
+            return
+        if not self.reach[self.component[start]] & self.terminal_mask:
+            return
+        found = 0
+        path = [start]
+        on_path = {start}
+        stack = [iter(self.adjacency[start])]
+        if len(self.adjacency[start]) == 0:
+            yield [self.states[start]]
+            return
+        while stack:
+            succ = next(stack[-1], None)
+            if succ is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if succ in on_path or not self.reach[self.component[succ]] & self.terminal_mask:
+                continue
+            if len(self.adjacency[succ]) == 0:
+                yield [self.states[idx] for idx in path] + [self.states[succ]]
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+                continue
+            path.append(succ)
+            on_path.add(succ)
+            stack.append(iter(self.adjacency[succ]))
+
+
+# iterative tarjan algorithm, returns component of every vertex and the list
+# of components in reverse topological order
+def stronglyConnected(adjacency):
+    index = [None] * len(adjacency)
+    lowlink = [0] * len(adjacency)
+    on_stack = [False] * len(adjacency)
+    component = [None] * len(adjacency)
+    components = []
+    stack = []
+    counter = 0
+    for root in range(len(adjacency)):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            vertex, child = work.pop()
+            if child == 0:
+                index[vertex] = lowlink[vertex] = counter
+                counter += 1
+                stack.append(vertex)
+                on_stack[vertex] = True
+            recurse = False
+            succ = adjacency[vertex]
+            while child < len(succ):
+                nxt = succ[child]
+                child += 1
+                if index[nxt] is None:
+                    work.append((vertex, child))
+                    work.append((nxt, 0))
+                    recurse = True
+                    break
+                elif on_stack[nxt]:
+                    lowlink[vertex] = min(lowlink[vertex], index[nxt])
+            if recurse:
+                continue
+            if lowlink[vertex] == index[vertex]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = len(components)
+                    members.append(member)
+                    if member == vertex:
+                        break
+                components.append(members)
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[vertex])
+    return component, components
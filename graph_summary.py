@@ -0,0 +1,155 @@
+# level of detail views of large state graphs: states are collapsed into
+# summary nodes, the neighbourhood of a focus state is cut out and the number
+# of rendered nodes and edges is capped so that graphviz work stays bounded
+import collections
+
+from graph_index import stronglyConnected
+from graph_writer import quoteDot
+from state_graph import edgeColor, getStateText, nodeStyle
+
+
+class SummaryGraph(object):
+    # groups maps a group key to its states in discovery order and edges maps
+    # (source group, target group) to a Counter of (desc, transition); edges
+    # inside a group are only counted
+    def __init__(self):
+        self.groups = collections.OrderedDict()
+        self.group_of = {}
+        self.edges = collections.OrderedDict()
+        self.internal = collections.Counter()
+        self.hidden_states = 0
+        self.hidden_edges = 0
+
+    def label(self, group):
+        states = self.groups[group]
+        if len(states) == 1:
+            return getStateText(states[0])
+        text = "%s\n%d states" % (group, len(states))
+        if self.internal[group]:
+            text += ", %d internal edges" % self.internal[group]
+        return text
+
+    def terminal(self, group):
+        return all(len(state.next_states) == 0 for state in self.groups[group])
+
+
+# key is a function of a state returning the summary node it belongs to
+def summarize(states, edges, key):
+    summary = SummaryGraph()
+    for state in states:
+        group = key(state)
+        summary.groups.setdefault(group, []).append(state)
+        summary.group_of[state.key()] = group
+    for edge in edges:
+        source = summary.group_of.get(edge['source'].key())
+        target = summary.group_of.get(edge['target'].key())
+        if source is None or target is None:
+            continue
+        if source == target:
+            summary.internal[source] += 1
+            continue
+        counts = summary.edges.setdefault((source, target), collections.Counter())
+        counts[(edge['explanation'], edge['transition'])] += 1
+    return summary
+
+
+# every state is its own summary node
+def stateKey(state):
+    return state.name
+
+
+# strongly connected components, named after their first state
+def componentKey(states):
+    number = {state.key(): idx for idx, state in enumerate(states)}
+    component = stronglyConnected([[number[succ.key()] for succ in state.next_states
+                                    if succ.key() in number] for state in states])[0]
+    first = {}
+    for idx, state in enumerate(states):
+        first.setdefault(component[idx], 'scc ' + state.name)
+    return lambda state: first[component[number[state.key()]]]
+
+
+# states sharing the values of the given (quantity, part) references
+def valueKey(*refs):
+    def key(state):
+        return ', '.join('%s %s=%s' % (quantity, part, state.getName(quantity, part))
+                         for quantity, part in refs)
+    return key
+
+
+# states and edges at most radius edges away from focus in either direction
+def neighbourhood(states, edges, focus, radius=1):
+    outgoing = collections.defaultdict(list)
+    incoming = collections.defaultdict(list)
+    for edge in edges:
+        outgoing[edge['source'].key()].append(edge)
+        incoming[edge['target'].key()].append(edge)
+    selected = {focus.key()}
+    frontier = [focus.key()]
+    for _ in range(radius):
+        neighbours = [edge['target'].key() for st in frontier for edge in outgoing[st]]
+        neighbours += [edge['source'].key() for st in frontier for edge in incoming[st]]
+        frontier = [st for st in neighbours if st not in selected]
+        selected.update(frontier)
+    return ([state for state in states if state.key() in selected],
+            [edge for edge in edges if edge['source'].key() in selected
+             and edge['target'].key() in selected])
+
+
+# keeps at most max_nodes summary nodes in breadth first order from the start
+# group and at most max_edges of the heaviest edges between kept nodes
+def capGraph(summary, max_nodes=None, max_edges=None, start=None):
+    if max_nodes is not None and len(summary.groups) > max_nodes:
+        adjacency = collections.defaultdict(list)
+        for source, target in summary.edges:
+            adjacency[source].append(target)
+            adjacency[target].append(source)
+        if start is None:
+            start = next(iter(summary.groups))
+        kept = [start][:max_nodes]
+        seen = set(kept)
+        idx = 0
+        # groups unreachable from start follow in discovery order
+        pending = iter(summary.groups)
+        while len(kept) < max_nodes:
+            if idx == len(kept):
+                group = next(group for group in pending if group not in seen)
+                kept.append(group)
+                seen.add(group)
+                continue
+            for group in adjacency[kept[idx]]:
+                if group not in seen and len(kept) < max_nodes:
+                    kept.append(group)
+                    seen.add(group)
+            idx += 1
+        for group in list(summary.groups):
+            if group not in seen:
+                summary.hidden_states += len(summary.groups.pop(group))
+        for pair in list(summary.edges):
+            if pair[0] not in seen or pair[1] not in seen:
+                summary.hidden_edges += sum(summary.edges.pop(pair).values())
+    if max_edges is not None and len(summary.edges) > max_edges:
+        heaviest = sorted(summary.edges, key=lambda pair: -sum(summary.edges[pair].values()))
+        for pair in heaviest[max_edges:]:
+            summary.hidden_edges += sum(summary.edges.pop(pair).values())
+    return summary
+
+
+def writeSummary(summary, stream):
+    stream.write('digraph G {\ncenter=true;\nsize=15;\n')
+    for group in summary.groups:
+        fill, border = nodeStyle(summary.terminal(group))
+        shape = 'rectangle' if len(summary.groups[group]) == 1 else 'box3d'
+        stream.write('%s [shape=%s, style=filled, fillcolor="%s", penwidth=%s];\n'
+                     % (quoteDot(summary.label(group)), shape, fill, border))
+    for (source, target), counts in summary.edges.items():
+        (desc, transition), count = counts.most_common(1)[0]
+        total = sum(counts.values())
+        label = desc if total == 1 else "%s (%d of %d)" % (desc, count, total)
+        stream.write('%s -> %s [label=%s, color="%s", penwidth=%s];\n'
+                     % (quoteDot(summary.label(source)), quoteDot(summary.label(target)),
+                        quoteDot(label), edgeColor(transition), min(2.25 + total / 4.0, 8)))
+    if summary.hidden_states or summary.hidden_edges:
+        stream.write('%s [shape=note];\n' % quoteDot(
+            "%d states and %d edges not shown" % (summary.hidden_states, summary.hidden_edges)))
+    stream.write('}\n')
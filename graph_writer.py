@@ -0,0 +1,112 @@
+# streaming export of the state graph to DOT and JSON Lines, nodes and edges
+# are written as soon as they are discovered and never kept in memory
+import collections
+import json
+
+from qr_model import State
+from state_graph import edgeColor, getStateText, nodeStyle, quantityNames
+
+
+def quoteDot(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+class DotWriter(object):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self):
+        self.stream.write('digraph G {\ncenter=true;\nsize=15;\n')
+
+    # node is written when its successors are known, DOT allows a node to be
+    # referenced by edges before it is declared
+    def addNode(self, state, terminal):
+        fill, border = nodeStyle(terminal)
+        self.stream.write('%s [shape=rectangle, style=filled, fillcolor="%s", penwidth=%s];\n'
+                          % (quoteDot(getStateText(state)), fill, border))
+
+    def addEdge(self, source, target, desc, transition):
+        self.stream.write('%s -> %s [label=%s, color="%s", penwidth=2.25];\n'
+                          % (quoteDot(getStateText(source)), quoteDot(getStateText(target)),
+                             quoteDot(desc), edgeColor(transition)))
+
+    def end(self):
+        self.stream.write('}\n')
+
+
+class JsonlWriter(object):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self):
+        pass
+
+    def addNode(self, state, terminal):
+        fill, border = nodeStyle(terminal)
+        values = {quantity: [state.getName(quantity, 'mag'), state.getName(quantity, 'der')]
+                  for quantity in quantityNames(state)}
+        self.write({'type': 'node', 'name': state.name, 'values': values,
+                    'desc': state.desc, 'terminal': terminal,
+                    'fillcolor': fill, 'penwidth': border})
+
+    def addEdge(self, source, target, desc, transition):
+        self.write({'type': 'edge', 'source': source.name, 'target': target.name,
+                    'desc': desc, 'transition': transition, 'color': edgeColor(transition)})
+
+    def end(self):
+        pass
+
+    def write(self, record):
+        self.stream.write(json.dumps(record) + '\n')
+
+
+# breadth first search which only keeps the index of state names and the
+# fringe, same numbering as state_graph.envision; returns number of states
+def streamEnvision(initial_state, table, writers):
+    space = initial_state.space
+    index = {initial_state.values: initial_state.name}
+    fringe = collections.deque([(initial_state.values, initial_state.name, initial_state.desc)])
+    for writer in writers:
+        writer.begin()
+
+    while fringe:
+        values, name, desc = fringe.popleft()
+        curr_state = State(space, values)
+        curr_state.name, curr_state.desc = name, desc
+        terminal = True
+        for new_values, rule in table.successors(values):
+            target = State(space, new_values)
+            target_name = index.get(new_values)
+            if target_name is None:
+                target.name = str(len(index))
+                target.desc = desc if rule.note is None else rule.note
+                index[new_values] = target.name
+                fringe.append((new_values, target.name, target.desc))
+            elif new_values != values:
+                target.name = target_name
+            else:
+                continue
+            terminal = False
+            for writer in writers:
+                writer.addEdge(curr_state, target, rule.desc, rule.transition)
+        for writer in writers:
+            writer.addNode(curr_state, terminal)
+
+    for writer in writers:
+        writer.end()
+    return len(index)
+
+
+# writes already computed states and edges, e.g. from the parallel explorer
+def writeGraph(states, edges, writers):
+    for writer in writers:
+        writer.begin()
+    for edge in edges:
+        for writer in writers:
+            writer.addEdge(edge['source'], edge['target'],
+                           edge['explanation'], edge['transition'])
+    for state in states:
+        for writer in writers:
+            writer.addNode(state, len(state.next_states) == 0)
+    for writer in writers:
+        writer.end()
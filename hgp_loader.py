@@ -0,0 +1,309 @@
+# loader of Garp3 model files (.hgp), the file is a binary XPCE object dump
+# which is decoded in one pass over a memory map and turned into quantity
+# spaces, quantities, relations and scenarios of the project
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from qr_model import Model, NZP, QSpace, ZP, ZPM
+
+WORD = struct.Struct('>i')
+# values stored by a single character
+CONSTANTS = {'n': None, 'd': 'default', 'a': True, 'u': False, 'c': 'class_default'}
+# names of values used by the project quantity spaces
+VALUE_NAMES = {'Zero': '0', 'Plus': '+', 'Minus': '-', 'Maximum': 'm'}
+COMPILED_VERSION = 1
+
+
+class PceObject(object):
+    __slots__ = ('class_name', 'ref', 'slots', 'content')
+
+    def __init__(self, class_name, ref):
+        self.class_name = class_name
+        self.ref = ref
+        self.slots = {}
+        self.content = None
+
+    def get(self, slot):
+        return self.slots.get(slot)
+
+
+class HgpDecoder(object):
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+        self.classes = {}
+        self.objects = {}
+
+    def word(self):
+        val = WORD.unpack_from(self.buffer, self.pos)[0]
+        self.pos += 4
+        return val
+
+    def string(self):
+        size = self.word()
+        text = self.buffer[self.pos:self.pos + size].decode('latin-1')
+        self.pos += size
+        return text
+
+    def char(self):
+        c = chr(self.buffer[self.pos])
+        self.pos += 1
+        return c
+
+    # returns the root object and the list of hypers linking objects
+    def decode(self):
+        if self.string() != 'PCE version 4':
+            raise ValueError("not a Garp3 model file")
+        self.word()
+        root = self.value()
+        hypers = []
+        c = self.char()
+        while c == 's':
+            hypers.append(self.value())
+            c = self.char()
+        if c != 'x':
+            raise ValueError("unexpected %r at offset %d" % (c, self.pos - 1))
+        return root, hypers
+
+    def value(self):
+        c = self.char()
+        if c == 'I':
+            return self.word()
+        if c == 'N':
+            return self.string()
+        if c in CONSTANTS:
+            return CONSTANTS[c]
+        if c in '123456789':
+            return ('arg', int(c))
+        if c == 'R':
+            return self.objects[self.value()]
+        if c == 'C':
+            name = self.string()
+            class_id = self.word()
+            self.classes[class_id] = (name, [self.string() for _ in range(self.word())])
+            c = self.char()
+        if c == 'O':
+            return self.instance()
+        raise ValueError("unexpected %r at offset %d" % (c, self.pos - 1))
+
+    def instance(self):
+        class_name, slots = self.classes[self.word()]
+        obj = PceObject(class_name, self.value())
+        self.objects[obj.ref] = obj
+        if self.char() != 'x':
+            raise ValueError("unexpected object extension at offset %d" % (self.pos - 1))
+        for slot in slots:
+            obj.slots[slot] = self.value()
+        # classes which save their content after the slots
+        if class_name == 'string':
+            obj.content = self.string()
+        elif class_name in ('date', 'number'):
+            obj.content = self.word()
+        elif slots == ['refer', 'size']:
+            obj.content = self.members('s', 2)
+        elif slots == ['size']:
+            obj.content = self.members('e', 1)
+        return obj
+
+    # members of hash tables and chains terminated by X
+    def members(self, marker, arity):
+        items = []
+        c = self.char()
+        while c == marker:
+            item = tuple(self.value() for _ in range(arity))
+            items.append(item if arity > 1 else item[0])
+            c = self.char()
+        if c != 'X':
+            raise ValueError("unexpected %r at offset %d" % (c, self.pos - 1))
+        return items
+
+
+@contextlib.contextmanager
+def mapFile(path):
+    with open(path, 'rb') as hgp_file:
+        buffer = mmap.mmap(hgp_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+
+def text(obj):
+    if isinstance(obj, PceObject):
+        if obj.class_name == 'translatable':
+            values = obj.get('values').content
+            return text(values[0][1]) if values else ''
+        if obj.class_name == 'string':
+            return obj.content
+    return obj
+
+
+def elements(chain):
+    return chain.content if chain is not None and chain.content is not None else []
+
+
+# compiles the decoded objects into plain data which can be stored as json
+def compileModel(root, hypers):
+    links = {}
+    for hyper in hypers:
+        if hyper.class_name != 'hyper':
+            continue
+        links.setdefault(id(hyper.get('from')), []).append((hyper.get('forward_name'), hyper.get('to')))
+        links.setdefault(id(hyper.get('to')), []).append((hyper.get('backward_name'), hyper.get('from')))
+
+    def linked(obj, name):
+        return [other for link, other in links.get(id(obj), []) if link == name]
+
+    spaces = {}
+    for space in elements(root.get('quantitySpaces')):
+        values = [(text(val.get('valueName_translatable')), val.get('type'))
+                  for val in elements(space.get('values'))]
+        # values are stored from the highest one
+        spaces[text(space.get('name_translatable'))] = values[::-1]
+
+    fragments = {}
+    for fragment in elements(root.get('modelFragments')):
+        quantities = []
+        names = {}
+        relations = []
+        correspondences = []
+        for element in elements(fragment.get('elements')):
+            if element.class_name == 'garpQuantity':
+                definition = linked(element, 'definition')[0]
+                name = text(definition.get('name_translatable')).lower()
+                if name in names.values():
+                    instance = linked(element, 'garpInstance')
+                    name = text(instance[0].get('name_translatable')).lower() + '_' + name
+                names[id(element)] = name
+                value = linked(element, 'value')
+                quantities.append({
+                    'name': name,
+                    'space': text(linked(element, 'quantitySpace')[0].get('name_translatable')),
+                    'value': text(value[0].get('valueReference').get('valueName_translatable'))
+                             if value else None})
+        for element in elements(fragment.get('elements')):
+            if element.class_name not in ('garpQuantityRelation', 'correspondence'):
+                continue
+            first = names.get(id(linked(element, 'argument1')[0]))
+            second = names.get(id(linked(element, 'argument2')[0]))
+            if element.class_name == 'garpQuantityRelation':
+                relations.append([element.get('type'),
+                                  1 if element.get('sign') == 'plus' else -1, first, second])
+            else:
+                values = [text(val.get('valueName_translatable')) if val is not None else None
+                          for val in (element.get('argument1Value'), element.get('argument2Value'))]
+                correspondences.append({
+                    'quantities': [first, second], 'values': values,
+                    'derivative': element.get('derivative'), 'directed': element.get('directed'),
+                    'mirror': element.get('mirror'), 'full': element.get('full')})
+        fragments[text(fragment.get('name_translatable'))] = {
+            'kind': fragment.class_name, 'quantities': quantities,
+            'relations': relations, 'correspondences': correspondences}
+    return {'version': COMPILED_VERSION, 'name': root.get('name'),
+            'spaces': spaces, 'fragments': fragments}
+
+
+# compiled form is stored in cache_dir under the hash of the file content,
+# the file is mapped once for hashing and decoding
+def loadCompiled(path, cache_dir=None):
+    cache_path = None
+    with mapFile(path) as buffer:
+        if cache_dir is not None:
+            digest = hashlib.sha256(buffer).hexdigest()
+            cache_path = os.path.join(cache_dir, digest + '.json')
+            try:
+                with open(cache_path) as cache_file:
+                    compiled = json.load(cache_file)
+                if compiled.get('version') == COMPILED_VERSION:
+                    return compiled
+            except (OSError, ValueError):
+                pass
+        root, hypers = HgpDecoder(buffer).decode()
+    compiled = compileModel(root, hypers)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(compiled, cache_file)
+        os.replace(tmp_path, cache_path)
+    return compiled
+
+
+class GarpSpace:
+    def __init__(self, names, vals, stationary):
+        self.names = names
+        self.vals = vals
+        self.stationary = stationary
+
+
+# project quantity space for the list of (value name, point or interval)
+def quantitySpace(values):
+    names = [VALUE_NAMES.get(name, name) for name, _ in values]
+    for known in (NZP(), ZP(), ZPM()):
+        if known.names == names:
+            return known
+    value_names = [name for name, _ in values]
+    zero = value_names.index('Zero') if 'Zero' in value_names else 0
+    return GarpSpace(names, [idx - zero for idx in range(len(values))],
+                     [kind == 'point' for _, kind in values])
+
+
+# builds model from a model fragment, value correspondences of all points
+# of equal quantity spaces are turned into full correspondences
+def buildModel(compiled, fragment):
+    definition = compiled['fragments'][fragment]
+    model = Model(fragment)
+    for quantity in definition['quantities']:
+        model.addQuantity(quantity['name'], quantitySpace(compiled['spaces'][quantity['space']]))
+    for kind, sign, source, target in definition['relations']:
+        if kind == 'inf':
+            model.addInfluence(source, target, sign)
+        elif kind == 'prop':
+            model.addProportionality(source, target, sign)
+
+    pairs = {}
+    for corr in definition['correspondences']:
+        if corr['derivative'] or corr['directed']:
+            continue
+        pair = tuple(sorted(corr['quantities']))
+        if corr['full']:
+            pairs[pair] = None
+        elif pair not in pairs or pairs[pair] is not None:
+            pairs.setdefault(pair, set()).add(tuple(corr['values']))
+    spaces = {q['name']: q['space'] for q in definition['quantities']}
+    for (first, second), values in sorted(pairs.items()):
+        if spaces[first] != spaces[second]:
+            continue
+        points = [name for name, kind in compiled['spaces'][spaces[first]] if kind == 'point']
+        if values is None or all((point, point) in values for point in points):
+            model.addCorrespondence(first, second)
+    # Garp3 models have no transition rules, they are derived from the relations
+    model.deriveRules()
+    return model
+
+
+# initial state of a scenario (input system) in the quantity order of the model,
+# derivatives which are not given by the scenario are zero
+def scenarioState(compiled, model, scenario):
+    values = {q['name']: q['value'] for q in compiled['fragments'][scenario]['quantities']}
+    quantities = []
+    for (name, part), q_model in zip(model.quantities, model.models):
+        value = values.get(name) if part == 'mag' else None
+        if value is None:
+            idx = q_model.vals.index(0) if 0 in q_model.vals else 0
+        else:
+            idx = q_model.names.index(VALUE_NAMES.get(value, value))
+        quantities.append(QSpace(name + '_' + part, q_model, idx))
+    return model.initialState(quantities)
+
+
+def loadModel(path, fragment, scenario=None, cache_dir=None):
+    compiled = loadCompiled(path, cache_dir)
+    model = buildModel(compiled, fragment)
+    if scenario is None:
+        return model, None
+    return model, scenarioState(compiled, model, scenario)
@@ -0,0 +1,207 @@
+# incremental envisionment, after an edit of the rules or of the initial state
+# only states matched by added or removed rules and newly discovered states
+# are expanded, expansions of all other states are reused from the last run
+import collections
+import itertools
+
+from qr_model import RULE_KINDS, State
+
+
+# compiled rules with equal signatures produce the same successors
+def ruleSignature(rule):
+    return (rule.kind, rule.desc, rule.transition, rule.note,
+            tuple(sorted((pos, tuple(sorted(allowed))) for pos, allowed in rule.tests)),
+            tuple(sorted((pos, other, tuple(sorted(allowed)))
+                         for pos, other, allowed in rule.pair_tests)),
+            tuple(rule.delta))
+
+
+class IncrementalEnvisionment(object):
+    # states keep their names between updates, states which are discovered by
+    # an update get new names and are appended to states; the first run gives
+    # the result of envision, later runs the same states and edges with a desc
+    # of a path that reaches the state
+    def __init__(self, model, initial_state=None):
+        self.model = model
+        self.table = model.compile()
+        self.expanded = 0
+        self.dropped = []
+        if initial_state is None:
+            initial_state = model.zeroState()
+        self.initial_values = initial_state.values
+        self.reset()
+        self.rebuild()
+
+    # nodes maps values to reached states, outgoing the values of a state to
+    # its edges and by_value (position, value index) to the values of the
+    # reached states having that value, to look up the states a rule matches
+    def reset(self):
+        self.nodes = {}
+        self.outgoing = {}
+        self.by_value = collections.defaultdict(set)
+        self.next_name = 0
+        self.states = []
+        self.edges = []
+
+    # rules of the model or the initial state were edited, returns the new
+    # states and edges; initial_state defaults to the last one or to all
+    # quantities being zero when the quantities of the model changed
+    def update(self, model=None, initial_state=None):
+        affected = set()
+        if model is not None:
+            affected = self.updateRules(model)
+            if affected is None:
+                if initial_state is None:
+                    initial_state = model.zeroState()
+                self.initial_values = initial_state.values
+                self.reset()
+                return self.rebuild()
+        moved = initial_state is not None and initial_state.values != self.initial_values
+        if moved:
+            self.initial_values = initial_state.values
+        return self.refresh(affected, moved)
+
+    # returns the values of the reached states whose expansion changed, None
+    # when the quantities changed and nothing can be reused
+    def updateRules(self, model):
+        table = model.compile()
+        old_space, space = self.table.space, table.space
+        if old_space.quantities != space.quantities or old_space.maximum != space.maximum:
+            self.model, self.table = model, table
+            return None
+
+        # unchanged rules of the new table are replaced by the compiled rules
+        # of the old one, so expansions in the memo stay valid
+        old_rules = {ruleSignature(rule): rule for rule in self.table.ordered}
+        new_rules = set()
+        changed = []
+        for kind, rules in table.rules.items():
+            for idx, rule in enumerate(rules):
+                sig = ruleSignature(rule)
+                new_rules.add(sig)
+                if sig in old_rules:
+                    rules[idx] = old_rules[sig]
+                else:
+                    changed.append(rule)
+        table.ordered = [rule for kind in RULE_KINDS for rule in table.rules[kind]]
+        changed += [rule for sig, rule in old_rules.items() if sig not in new_rules]
+        table.table = self.table.table
+        affected = set()
+        for rule in changed:
+            affected.update(values for values in self.candidates(rule) if rule.matches(values))
+        for values in affected:
+            table.table.pop(values, None)
+        self.model, self.table = model, table
+        return affected
+
+    # reached states which pass the most selective single value test of the rule
+    def candidates(self, rule):
+        tests = [(pos, allowed) for pos, allowed in rule.tests]
+        tests += [(pos, {i for i, _ in allowed}) for pos, _, allowed in rule.pair_tests]
+        if not tests:
+            return list(self.nodes)
+        pos, allowed = min(tests, key=lambda test: sum(len(self.by_value[(test[0], val)])
+                                                       for val in test[1]))
+        return [values for val in allowed for values in self.by_value[(pos, val)]]
+
+    # breadth first search over the expansions, same order as envision
+    def rebuild(self):
+        self.expanded = 0
+        self.dropped = []
+        initial = self.node(self.initial_values)
+        initial.desc = ""
+        self.states = [initial]
+        fringe = collections.deque([initial])
+        while fringe:
+            for state in self.expand(fringe.popleft()):
+                self.states.append(state)
+                fringe.append(state)
+        self.edges = list(itertools.chain.from_iterable(
+            self.outgoing[state.values] for state in self.states))
+        return self.states, self.edges
+
+    # expands the affected states and the states they discover, the reached
+    # states are only searched again when edges were removed or the initial
+    # state changed
+    def refresh(self, affected, moved=False):
+        self.expanded = 0
+        self.dropped = []
+        initial_known = self.initial_values in self.nodes
+        initial = self.node(self.initial_values)
+        fringe = collections.deque([self.nodes[values] for values in affected])
+        if moved:
+            initial.desc = ""
+        if not initial_known:
+            self.states.append(initial)
+            fringe.append(initial)
+        removed = moved
+        changed = bool(fringe)
+        while fringe:
+            state = fringe.popleft()
+            old_targets = {id(target) for target in state.next_states}
+            for target in self.expand(state):
+                self.states.append(target)
+                fringe.append(target)
+            if not old_targets <= {id(target) for target in state.next_states}:
+                removed = True
+
+        if removed:
+            self.dropUnreachable(initial)
+        if changed or removed:
+            self.edges = list(itertools.chain.from_iterable(
+                self.outgoing[state.values] for state in self.states))
+        return self.states, self.edges
+
+    # sets the edges of the state, returns the states it discovered
+    def expand(self, curr_state):
+        if curr_state.values not in self.table.table:
+            self.expanded += 1
+        discovered = []
+        curr_state.next_states = []
+        edges = self.outgoing[curr_state.values] = []
+        for values, rule in self.table.successors(curr_state.values):
+            same_state = self.nodes.get(values)
+            if same_state is None:
+                same_state = self.node(values)
+                same_state.desc = curr_state.desc if rule.note is None else rule.note
+                discovered.append(same_state)
+            elif same_state is curr_state:
+                continue
+            curr_state.next_states.append(same_state)
+            edges.append({"explanation": rule.desc, "source": curr_state,
+                          "target": same_state, "transition": rule.transition})
+        return discovered
+
+    # unreachable states and their expansions are dropped, the reached states
+    # are put into breadth first order again and get the desc envision gives
+    # them, the search only reads the memo
+    def dropUnreachable(self, initial):
+        reached = {initial.values}
+        order = [initial]
+        for curr_state in order:
+            for values, rule in self.table.successors(curr_state.values):
+                if values not in reached:
+                    reached.add(values)
+                    target = self.nodes[values]
+                    target.desc = curr_state.desc if rule.note is None else rule.note
+                    order.append(target)
+        self.dropped = [state for state in self.states if state.values not in reached]
+        for state in self.dropped:
+            del self.nodes[state.values]
+            del self.outgoing[state.values]
+            self.table.table.pop(state.values, None)
+            for pos, val in enumerate(state.values):
+                self.by_value[(pos, val)].discard(state.values)
+        self.states = order
+
+    def node(self, values):
+        state = self.nodes.get(values)
+        if state is None:
+            state = State(self.table.space, values)
+            state.name = str(self.next_name)
+            self.next_name += 1
+            self.nodes[values] = state
+            self.outgoing[values] = []
+            for pos, val in enumerate(values):
+                self.by_value[(pos, val)].add(values)
+        return state
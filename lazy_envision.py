@@ -0,0 +1,130 @@
+# breadth first envisionment as a generator, states and edges are yielded as
+# soon as they are discovered and the search stops at a goal or a budget
+import collections
+import sys
+import time
+
+from qr_model import State
+from state_graph import createEdge
+
+# reasons why the exploration stopped
+COMPLETE = 'complete'
+GOAL = 'goal'
+DEPTH = 'depth'
+STATES = 'states'
+TIME = 'time'
+MEMORY = 'memory'
+
+
+class LazyEnvisionment(object):
+    # yields ('state', state) when a state is discovered and ('edge', edge)
+    # for every edge, limits are None for no limit: states deeper than
+    # max_depth are not expanded, max_time is in seconds and max_memory in
+    # bytes of the index and fringe kept by the search; goal is a predicate
+    # of a state and stops the search at the first state for which it holds
+    def __init__(self, initial_state, table, max_depth=None, max_states=None,
+                 max_time=None, max_memory=None, goal=None):
+        self.initial_state = initial_state
+        self.table = table
+        self.max_depth = max_depth
+        self.max_states = max_states
+        self.max_time = max_time
+        self.max_memory = max_memory
+        self.goal = goal
+        self.stopped = None
+        self.goal_state = None
+        self.num_states = 0
+        self.num_edges = 0
+
+    def __iter__(self):
+        space = self.initial_state.space
+        start = time.perf_counter()
+        index = {self.initial_state.values: self.initial_state}
+        fringe = collections.deque([(self.initial_state, 0)])
+        # every iteration starts over, the initial state is the only state
+        # shared with earlier ones
+        self.initial_state.next_states = []
+        self.stopped = None
+        self.goal_state = None
+        self.num_states, self.num_edges = 0, 0
+        if self.max_states is not None and self.max_states < 1:
+            self.stopped = STATES
+            return
+        self.num_states = 1
+        yield 'state', self.initial_state
+        if self.reachedGoal(self.initial_state):
+            return
+        entry_size = None
+        cut = False
+
+        while fringe:
+            stopped = self.exhausted(start, index, fringe, entry_size)
+            if stopped is not None:
+                self.stopped = stopped
+                return
+            curr_state, depth = fringe.popleft()
+            if self.max_depth is not None and depth >= self.max_depth:
+                cut = True
+                continue
+            for values, rule in self.table.successors(curr_state.values):
+                same_state = index.get(values)
+                if same_state is None:
+                    # the budget is checked before a state is added, so the
+                    # search stops at the first state over the limit
+                    if self.max_states is not None and self.num_states >= self.max_states:
+                        self.stopped = STATES
+                        return
+                    same_state = State(space, values)
+                    same_state.name = str(len(index))
+                    same_state.desc = curr_state.desc if rule.note is None else rule.note
+                    index[values] = same_state
+                    fringe.append((same_state, depth + 1))
+                    self.num_states += 1
+                    if entry_size is None:
+                        entry_size = sys.getsizeof(same_state) + sys.getsizeof(values)
+                    yield 'state', same_state
+                elif same_state is curr_state:
+                    continue
+                curr_state.next_states.append(same_state)
+                self.num_edges += 1
+                yield 'edge', createEdge(curr_state, same_state, rule.desc, rule.transition)
+                if self.reachedGoal(same_state):
+                    return
+        self.stopped = DEPTH if cut else COMPLETE
+
+    def reachedGoal(self, state):
+        if self.goal is not None and self.goal_state is None and self.goal(state):
+            self.goal_state = state
+            self.stopped = GOAL
+            return True
+        return False
+
+    def exhausted(self, start, index, fringe, entry_size):
+        if self.max_time is not None and time.perf_counter() - start > self.max_time:
+            return TIME
+        if self.max_memory is not None and entry_size is not None:
+            used = sys.getsizeof(index) + sys.getsizeof(fringe) + len(index) * entry_size
+            if used > self.max_memory:
+                return MEMORY
+        return None
+
+    # consumes the generator and returns states and edges like envision
+    def collect(self):
+        states, edges = [], []
+        for kind, item in self:
+            if kind == 'state':
+                states.append(item)
+            else:
+                edges.append(item)
+        return states, edges
+
+
+def iterExplore(model, initial_state=None, **limits):
+    if initial_state is None:
+        initial_state = model.zeroState()
+    return LazyEnvisionment(initial_state, model.compile(), **limits)
+
+
+# predicate of states where quantity part has the value with the given name
+def valueIs(quantity, part, name):
+    return lambda state: state.getName(quantity, part) == name
@@ -0,0 +1,92 @@
+# level synchronous envisionment which expands every breadth first level in
+# a pool of processes, states are sent between processes as packed integers
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from qr_model import State
+from state_graph import addNewState, createEdge
+
+# transition table of the worker process, compiled once by initWorker
+worker_table = None
+
+
+def initWorker(model):
+    global worker_table
+    worker_table = model.compile()
+
+
+# returns for every code the list of (successor code, rule index)
+def expandCodes(codes, table=None):
+    if table is None:
+        table = worker_table
+    space = table.space
+    rule_index = {id(rule): idx for idx, rule in enumerate(table.ordered)}
+    result = []
+    for code in codes:
+        result.append([(space.encode(values), rule_index[id(rule)])
+                       for values, rule in table.successors(space.decode(code))])
+    return result
+
+
+def chunks(items, size):
+    for idx in range(0, len(items), size):
+        yield items[idx:idx + size]
+
+
+# same states and edges as state_graph.envision, workers sets the number of
+# processes and with workers=1 the levels are expanded in this process;
+# with a profiler the successors phase is the time waiting for the workers
+def envisionParallel(initial_state, model, workers=None, chunk_size=256, profiler=None):
+    table = model.compile()
+    space = initial_state.space
+    states = [initial_state]
+    state_index = {space.encode(initial_state.values): initial_state}
+    edges = []
+    frontier = [initial_state]
+
+    pool = None
+    if workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                   initargs=(model,))
+    try:
+        while frontier:
+            codes = [space.encode(state.values) for state in frontier]
+            if profiler is not None:
+                start = profiler.clock()
+            if pool is None:
+                expanded = expandCodes(codes, table)
+            else:
+                expanded = list(itertools.chain.from_iterable(
+                    pool.map(expandCodes, chunks(codes, chunk_size))))
+            if profiler is not None:
+                profiler.addTime('successors', start)
+                start = profiler.clock()
+
+            # results are merged in frontier order so numbering is deterministic
+            next_frontier = []
+            for curr_state, successors in zip(frontier, expanded):
+                for code, rule_idx in successors:
+                    rule = table.ordered[rule_idx]
+                    same_state = state_index.get(code)
+                    if profiler is not None:
+                        profiler.rule_counts[rule.desc] += 1
+                        profiler.stateFound(same_state is None)
+                    if same_state is None:
+                        new_state = State(space, space.decode(code))
+                        new_state.desc = curr_state.desc if rule.note is None else rule.note
+                        new_state.name = str(len(states))
+                        edges, states = addNewState(edges, states, curr_state, new_state,
+                                                    rule.desc, rule.transition)
+                        state_index[code] = new_state
+                        next_frontier.append(new_state)
+                    elif curr_state != same_state:
+                        curr_state.next_states.append(same_state)
+                        edges.append(createEdge(curr_state, same_state,
+                                                rule.desc, rule.transition))
+            if profiler is not None:
+                profiler.addTime('dedup', start)
+            frontier = next_frontier
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return states, edges
@@ -0,0 +1,69 @@
+# opt-in instrumentation of envisionment, code paths check once whether a
+# profiler was given so the disabled case costs a single comparison
+import collections
+import contextlib
+import json
+import os
+import time
+
+
+class Profiler(object):
+    def __init__(self):
+        self.clock = time.perf_counter
+        self.start = self.clock()
+        self.rule_counts = collections.Counter()
+        self.times = collections.defaultdict(float)
+        self.calls = collections.Counter()
+        self.new_states = 0
+        self.duplicate_states = 0
+        self.events = []
+
+    # adds time elapsed since start to the phase
+    def addTime(self, phase, start):
+        self.times[phase] += self.clock() - start
+        self.calls[phase] += 1
+
+    # new_states as returned by generateNextStates, desc identifies the rule
+    def rulesFired(self, new_states):
+        for state_dict in new_states:
+            self.rule_counts[state_dict['desc']] += 1
+
+    def stateFound(self, is_new):
+        if is_new:
+            self.new_states += 1
+        else:
+            self.duplicate_states += 1
+
+    # times a whole phase and records it as a trace event
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            end = self.clock()
+            self.times[name] += end - start
+            self.calls[name] += 1
+            self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                'ts': (start - self.start) * 1e6, 'dur': (end - start) * 1e6})
+
+    def report(self):
+        return {
+            'times': dict(self.times),
+            'calls': dict(self.calls),
+            'rules': dict(self.rule_counts.most_common()),
+            'new_states': self.new_states,
+            'duplicate_states': self.duplicate_states,
+        }
+
+    def writeReport(self, path):
+        with open(path, 'w') as out:
+            json.dump(self.report(), out, indent=2)
+
+    # chrome trace event format, viewable in chrome://tracing or perfetto
+    def writeTrace(self, path):
+        counters = [{'name': 'states', 'ph': 'C', 'pid': os.getpid(), 'tid': 0,
+                     'ts': (self.clock() - self.start) * 1e6,
+                     'args': {'new': self.new_states, 'duplicate': self.duplicate_states}}]
+        with open(path, 'w') as out:
+            json.dump({'traceEvents': self.events + counters}, out)
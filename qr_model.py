@@ -0,0 +1,465 @@
+# declarative definition of qualitative models: quantities with their quantity
+# spaces, influences (I+/I-), proportionalities (P+/P-), value correspondences
+# and rules which are compiled into transition tables used during envisionment
+import itertools
+import operator
+
+
+class NZP:
+    def __init__(self):
+        self.names = ['-', '0', '+']
+        self.vals = [-1, 0, 1]
+        self.stationary = [False, True, False]
+
+
+class ZP:
+    def __init__(self):
+        self.names = ['0', '+']
+        self.vals = [0, 1]
+        self.stationary = [True, False]
+
+
+class ZPM:
+    def __init__(self):
+        self.names = ['0', '+', 'm']
+        self.vals = [0, 1, 2]
+        self.stationary = [True, False, True]
+
+
+class QSpace(object):
+    def __init__(self, name, Qmodel, state):
+        self.name = name
+        self.q_model = Qmodel
+        self.current_state = state
+        self.maximum = len(self.q_model.vals)
+
+    def increase(self):
+        if self.current_state < self.maximum - 1:
+            self.current_state += 1
+
+    def decrease(self):
+        if self.current_state > 0:
+            self.current_state -= 1
+
+    def setStateAs(self, q_state):
+        # TODO add check if two states are the same
+        self.current_state = q_state.current_state
+
+    def getVal(self):
+        return self.q_model.vals[self.current_state]
+
+    def getName(self):
+        return self.q_model.names[self.current_state]
+
+    def isStationary(self):
+        return self.q_model.stationary[self.current_state]
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.getVal() == other.getVal()
+        return False
+
+
+class StateSpace(object):
+    # layout of a state vector shared by all states, quantity space
+    # models are referenced and never copied
+    def __init__(self, quantities, models):
+        self.quantities = list(quantities)
+        self.models = list(models)
+        self.position = {q: idx for idx, q in enumerate(self.quantities)}
+        self.maximum = [len(model.vals) for model in self.models]
+
+    # packs state values into a single mixed radix integer
+    def encode(self, values):
+        code = 0
+        for val, maximum in zip(values, self.maximum):
+            code = code * maximum + val
+        return code
+
+    def decode(self, code):
+        values = []
+        for maximum in reversed(self.maximum):
+            code, val = divmod(code, maximum)
+            values.append(val)
+        return tuple(reversed(values))
+
+
+class State(object):
+    __slots__ = ('space', 'values', 'next_states', 'name', 'desc')
+
+    def __init__(self, space, values):
+        self.space = space
+        self.values = values
+        self.next_states = []
+        self.name = "0"
+        self.desc = ""
+
+    # returns new state with applied list of (quantity, part, direction)
+    def applyChanges(self, changes):
+        values = list(self.values)
+        position = self.space.position
+        maximum = self.space.maximum
+        for quantity, part, direction in changes:
+            idx = position[(quantity, part)]
+            if direction == -1:
+                if values[idx] > 0:
+                    values[idx] -= 1
+            elif direction == 1:
+                if values[idx] < maximum[idx] - 1:
+                    values[idx] += 1
+        new_state = State(self.space, tuple(values))
+        new_state.desc = self.desc
+        return new_state
+
+    def getVal(self, quantity, part):
+        idx = self.space.position[(quantity, part)]
+        return self.space.models[idx].vals[self.values[idx]]
+
+    def getName(self, quantity, part):
+        idx = self.space.position[(quantity, part)]
+        return self.space.models[idx].names[self.values[idx]]
+
+    def isStationary(self, quantity, part):
+        idx = self.space.position[(quantity, part)]
+        return self.space.models[idx].stationary[self.values[idx]]
+
+    # canonical hashable key made of the quantity indices
+    def key(self):
+        return self.values
+
+    def __hash__(self):
+        return hash(self.values)
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.values == other.values
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# rules of kind exogenous fire only when no immediate rule fires,
+# successors are ordered by kind and then by declaration
+RULE_KINDS = ['immediate', 'exogenous', 'continuous']
+
+
+class Rule(object):
+    # when is a list of conditions (quantity, part), op, rhs where rhs is
+    # a value of the quantity space, another (quantity, part) or for op
+    # 'stationary' a boolean; changes is a list of (quantity, part, direction)
+    def __init__(self, desc, when, changes, transition="time", note=None,
+                 kind='continuous'):
+        if kind not in RULE_KINDS:
+            raise ValueError("unknown rule kind: " + str(kind))
+        self.desc = desc
+        self.when = list(when)
+        self.changes = list(changes)
+        self.transition = transition
+        self.note = note
+        self.kind = kind
+
+
+class Model(object):
+    def __init__(self, name):
+        self.name = name
+        self.quantities = []
+        self.models = []
+        self.influences = []
+        self.proportionalities = []
+        self.correspondences = []
+        self.rules = []
+        self.space = None
+
+    # every quantity has a magnitude and a derivative
+    def addQuantity(self, name, magnitude, derivative=None):
+        if derivative is None:
+            derivative = NZP()
+        if (name, 'mag') in self.quantities:
+            raise ValueError("quantity already defined: " + name)
+        self.quantities += [(name, 'mag'), (name, 'der')]
+        self.models += [magnitude, derivative]
+        self.space = None
+
+    # I+ (sign 1) or I- (sign -1) from magnitude of source to derivative of target
+    def addInfluence(self, source, target, sign=1):
+        self.checkQuantity(source)
+        self.checkQuantity(target)
+        self.influences.append((source, target, sign))
+
+    # P+ (sign 1) or P- (sign -1), derivative of target follows source
+    def addProportionality(self, source, target, sign=1):
+        self.checkQuantity(source)
+        self.checkQuantity(target)
+        self.proportionalities.append((source, target, sign))
+
+    # full correspondence, magnitudes of both quantities move together
+    def addCorrespondence(self, source, target):
+        self.checkQuantity(source)
+        self.checkQuantity(target)
+        if self.model(source, 'mag').names != self.model(target, 'mag').names:
+            raise ValueError("full correspondence needs equal quantity spaces: "
+                             + source + ", " + target)
+        self.correspondences.append((source, target))
+
+    def addRule(self, desc, when, changes, transition="time", note=None,
+                kind='continuous'):
+        rule = Rule(desc, when, changes, transition, note, kind)
+        for ref in [cond[0] for cond in rule.when] + [ch[:2] for ch in rule.changes]:
+            self.checkQuantity(*ref)
+        self.rules.append(rule)
+        return rule
+
+    def checkQuantity(self, quantity, part='mag'):
+        if (quantity, part) not in self.quantities:
+            raise ValueError("unknown quantity: " + str(quantity) + " " + str(part))
+
+    def model(self, quantity, part):
+        return self.models[self.quantities.index((quantity, part))]
+
+    def stateSpace(self):
+        if self.space is None:
+            self.space = StateSpace(self.quantities, self.models)
+        return self.space
+
+    # quantities is a list of QSpace objects in the order of model quantities
+    def initialState(self, quantities):
+        if len(quantities) != len(self.quantities):
+            raise ValueError("expected %d quantities" % len(self.quantities))
+        return State(self.stateSpace(), tuple(qt.current_state for qt in quantities))
+
+    # adds changes implied by proportionalities and correspondences
+    def propagateChanges(self, changes):
+        result = [tuple(ch) for ch in changes]
+        changed = {ch[:2] for ch in result}
+        idx = 0
+        while idx < len(result):
+            quantity, part, direction = result[idx]
+            idx += 1
+            if direction == 0:
+                continue
+            implied = []
+            if part == 'der':
+                implied = [(target, 'der', direction * sign)
+                           for source, target, sign in self.proportionalities
+                           if source == quantity]
+            else:
+                for source, target in self.correspondences:
+                    if source == quantity:
+                        implied.append((target, 'mag', direction))
+                    elif target == quantity:
+                        implied.append((source, 'mag', direction))
+            for ch in implied:
+                if ch[:2] not in changed:
+                    changed.add(ch[:2])
+                    result.append(ch)
+        return result
+
+    # rules derived from the relations for models without hand written rules:
+    # derivatives of quantities which are not influenced or proportional to
+    # another quantity are changed from outside, influenced derivatives move
+    # towards the qualitative sum of their influences, or to any value when
+    # the sum is ambiguous, and magnitudes follow their derivatives without
+    # passing extreme points; quantities in full correspondence change with
+    # their partner
+    def deriveRules(self):
+        names = [q for q, part in self.quantities if part == 'mag']
+        influenced = {}
+        for source, target, sign in self.influences:
+            influenced.setdefault(target, []).append((source, sign))
+        driven = set(influenced) | {target for _, target, _ in self.proportionalities}
+
+        for name in names:
+            if name in driven:
+                continue
+            vals = self.model(name, 'mag').vals
+            der = (name, 'der')
+            self.addRule(name[0].upper() + "d+", [(der, '==', -1)],
+                         [(name, 'der', 1)], transition="increase", kind='exogenous')
+            self.addRule(name[0].upper() + "d+", [(der, '==', 0), ((name, 'mag'), '<', vals[-1])],
+                         [(name, 'der', 1)], transition="increase", kind='exogenous')
+            self.addRule(name[0].upper() + "d-", [(der, '==', 1)],
+                         [(name, 'der', -1)], transition="decrease", kind='exogenous')
+            self.addRule(name[0].upper() + "d-", [(der, '==', 0), ((name, 'mag'), '>', vals[0])],
+                         [(name, 'der', -1)], transition="decrease", kind='exogenous')
+
+        for target in names:
+            if target not in influenced:
+                continue
+            sources = influenced[target]
+            signs = [sorted({(val > 0) - (val < 0) for val in self.model(source, 'mag').vals})
+                     for source, _ in sources]
+            mag, der = (target, 'mag'), (target, 'der')
+            desc = "I->" + target[0].upper() + "d"
+            for combination in itertools.product(*signs):
+                total = {sign * val for (_, sign), val in zip(sources, combination)} - {0}
+                when = [((source, 'mag'), ['<', '==', '>'][val + 1], 0)
+                        for (source, _), val in zip(sources, combination)]
+                # opposite influences are ambiguous and the derivative may
+                # become anything, which happens over time
+                kind = 'continuous' if len(total) > 1 else 'immediate'
+                results = [-1, 0, 1] if len(total) > 1 else [total.pop() if total else 0]
+                for bound, lowest, highest in self.extremeBounds(target):
+                    allowed = [r for r in results if lowest <= r <= highest] or [0]
+                    self.addRule(desc + "+", when + bound + [(der, '<', max(allowed))],
+                                 [(target, 'der', 1)], kind=kind)
+                    self.addRule(desc + "-", when + bound + [(der, '>', min(allowed))],
+                                 [(target, 'der', -1)], kind=kind)
+
+        # quantities linked by a chain of correspondences change together,
+        # one rule is derived for every group
+        group = {name: name for name in names}
+
+        def find(name):
+            while group[name] != name:
+                group[name] = group[group[name]]
+                name = group[name]
+            return name
+
+        for first, second in self.correspondences:
+            first, second = find(first), find(second)
+            if first != second:
+                group[max(first, second, key=names.index)] = min(first, second, key=names.index)
+        for name in names:
+            if find(name) == name:
+                self.addMagnitudeRules(name)
+
+    # conditions on the magnitude with the range of derivatives which do not
+    # point past an extreme point of the quantity space
+    def extremeBounds(self, name):
+        q_model = self.model(name, 'mag')
+        mag, vals = (name, 'mag'), q_model.vals
+        inside = []
+        bounds = []
+        if q_model.stationary[0]:
+            inside.append((mag, '>', vals[0]))
+            bounds.append(([(mag, '==', vals[0])], 0, 1))
+        if q_model.stationary[-1]:
+            inside.append((mag, '<', vals[-1]))
+            bounds.append(([(mag, '==', vals[-1])], -1, 0))
+        return [(inside, -1, 1)] + bounds
+
+    # magnitude follows the derivative, which becomes zero when the magnitude
+    # reaches an extreme point
+    def addMagnitudeRules(self, name):
+        q_model = self.model(name, 'mag')
+        mag, der, vals = (name, 'mag'), (name, 'der'), q_model.vals
+        desc = name[0].upper() + "m"
+        if q_model.stationary[-1]:
+            self.addRule(desc + "+", [(der, '>', 0), (mag, '<', vals[-2])], [(name, 'mag', 1)])
+            self.addRule(desc + "+", [(der, '>', 0), (mag, '==', vals[-2])],
+                         [(name, 'mag', 1), (name, 'der', -1)])
+        else:
+            self.addRule(desc + "+", [(der, '>', 0), (mag, '<', vals[-1])], [(name, 'mag', 1)])
+        if q_model.stationary[0]:
+            self.addRule(desc + "-", [(der, '<', 0), (mag, '>', vals[1])], [(name, 'mag', -1)])
+            self.addRule(desc + "-", [(der, '<', 0), (mag, '==', vals[1])],
+                         [(name, 'mag', -1), (name, 'der', 1)])
+        else:
+            self.addRule(desc + "-", [(der, '<', 0), (mag, '>', vals[0])], [(name, 'mag', -1)])
+
+    # all magnitudes and derivatives start at zero
+    def zeroState(self):
+        space = self.stateSpace()
+        return State(space, tuple(q_model.vals.index(0) for q_model in space.models))
+
+    def compile(self):
+        if self.influences and not self.rules:
+            raise ValueError("model %s has influences but no rules, call deriveRules()"
+                             % self.name)
+        return TransitionTable(self)
+
+
+class CompiledRule(object):
+    # conditions are turned into sets of allowed value indices and the
+    # changes into position deltas of the state vector
+    def __init__(self, rule, model):
+        space = model.stateSpace()
+        self.desc = rule.desc
+        self.transition = rule.transition
+        self.note = rule.note
+        self.kind = rule.kind
+        self.tests = []
+        self.pair_tests = []
+        for ref, op, rhs in rule.when:
+            pos = space.position[ref]
+            q_model = space.models[pos]
+            if op == 'stationary':
+                allowed = [i for i, st in enumerate(q_model.stationary) if st == rhs]
+                self.tests.append((pos, frozenset(allowed)))
+            elif isinstance(rhs, tuple):
+                other = space.position[rhs]
+                other_model = space.models[other]
+                allowed = [(i, j) for i, a in enumerate(q_model.vals)
+                           for j, b in enumerate(other_model.vals)
+                           if OPERATORS[op](a, b)]
+                self.pair_tests.append((pos, other, frozenset(allowed)))
+            else:
+                allowed = [i for i, a in enumerate(q_model.vals) if OPERATORS[op](a, rhs)]
+                self.tests.append((pos, frozenset(allowed)))
+        self.delta = [(space.position[(q, part)], direction)
+                      for q, part, direction in model.propagateChanges(rule.changes)
+                      if direction != 0]
+        self.maximum = space.maximum
+
+    def matches(self, values):
+        for pos, allowed in self.tests:
+            if values[pos] not in allowed:
+                return False
+        for pos, other, allowed in self.pair_tests:
+            if (values[pos], values[other]) not in allowed:
+                return False
+        return True
+
+    def apply(self, values):
+        values = list(values)
+        for pos, direction in self.delta:
+            val = values[pos] + direction
+            if 0 <= val < self.maximum[pos]:
+                values[pos] = val
+        return tuple(values)
+
+
+class TransitionTable(object):
+    # maps state values to the tuple of (successor values, compiled rule),
+    # entries are filled on first lookup or all at once by precompute
+    def __init__(self, model):
+        self.model = model
+        self.space = model.stateSpace()
+        self.rules = {kind: [CompiledRule(rule, model) for rule in model.rules
+                             if rule.kind == kind]
+                      for kind in RULE_KINDS}
+        self.ordered = [rule for kind in RULE_KINDS for rule in self.rules[kind]]
+        self.table = {}
+
+    def successors(self, values):
+        succ = self.table.get(values)
+        if succ is None:
+            succ = self.expand(values)
+            self.table[values] = succ
+        return succ
+
+    def expand(self, values):
+        result = [(rule.apply(values), rule) for rule in self.rules['immediate']
+                  if rule.matches(values)]
+        if len(result) == 0:
+            result += [(rule.apply(values), rule) for rule in self.rules['exogenous']
+                       if rule.matches(values)]
+        result += [(rule.apply(values), rule) for rule in self.rules['continuous']
+                   if rule.matches(values)]
+        return tuple(result)
+
+    # fills the table for the whole product of quantity spaces
+    def precompute(self):
+        for values in itertools.product(*[range(m) for m in self.space.maximum]):
+            self.successors(values)
+        return self
@@ -0,0 +1,303 @@
+# asyncio service answering queries over envisionments kept in memory, every
+# request and response is one JSON object per line; envisionments are
+# computed in a pool of processes and kept in a least recently used cache
+import asyncio
+import collections
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from graph_index import GraphIndex
+from graph_writer import DotWriter, writeGraph
+from qr_model import State, StateSpace
+from state_graph import bathtubInitialState, decodeDesc, explore
+
+# largest K of the chained-K and parallel-K families clients may request
+MAX_FAMILY_SIZE = 4
+
+
+# keys are 'bathtub', 'chained-K', 'parallel-K' or 'hgp:PATH:FRAGMENT[:SCENARIO]'
+def resolveModel(key):
+    if key == 'bathtub':
+        from bathtub import bathtubModel
+        model = bathtubModel()
+        return model, bathtubInitialState(model)
+    if key.startswith('hgp:'):
+        from hgp_loader import loadModel
+        parts = key.split(':')
+        if len(parts) not in [3, 4]:
+            raise ValueError("expected hgp:PATH:FRAGMENT[:SCENARIO]: " + key)
+        model, initial_state = loadModel(*parts[1:])
+        return model, initial_state
+    family, _, size = key.rpartition('-')
+    from benchmark import FAMILIES
+    if family not in FAMILIES or not size.isdigit():
+        raise ValueError("unknown model: " + key)
+    model = FAMILIES[family](int(size))
+    return model, model.zeroState()
+
+
+# checks a key of a client before any work is done for it: .hgp files are
+# only read from hgp_dir and families are limited to max_size containers;
+# returns the key with the path of an .hgp file made absolute
+def checkModel(key, hgp_dir=None, max_size=MAX_FAMILY_SIZE):
+    if key == 'bathtub':
+        return key
+    if key.startswith('hgp:'):
+        parts = key.split(':')
+        if len(parts) not in [3, 4]:
+            raise ValueError("expected hgp:PATH:FRAGMENT[:SCENARIO]: " + key)
+        if hgp_dir is None:
+            raise ValueError("hgp models are not served, no model directory is configured")
+        directory = os.path.realpath(hgp_dir)
+        path = os.path.realpath(os.path.join(directory, parts[1]))
+        if os.path.commonpath([directory, path]) != directory or not path.endswith('.hgp'):
+            raise ValueError("not an .hgp file in the model directory: " + parts[1])
+        return ':'.join(['hgp', path] + parts[2:])
+    family, _, size = key.rpartition('-')
+    from benchmark import FAMILIES
+    if family not in FAMILIES or not size.isdigit():
+        raise ValueError("unknown model: " + key)
+    if not 1 <= int(size) <= max_size:
+        raise ValueError("%s has to have 1 to %d containers: %s" % (family, max_size, key))
+    return key
+
+
+# runs in a worker process, states are sent back as plain tuples because
+# pickling the linked states recurses along next_states; with cache_dir the
+# envisionment is read from or stored in the on disk cache
+def computeGraph(key, cache_dir=None):
+    model, initial_state = resolveModel(key)
+    if cache_dir:
+        from envision_cache import EnvisionCache
+        states, edges = EnvisionCache(cache_dir).envision(model, initial_state)
+    else:
+        states, edges = explore(model, initial_state)
+    number = {id(state): idx for idx, state in enumerate(states)}
+    space = states[0].space
+    return {
+        'quantities': space.quantities,
+        'models': space.models,
+        'states': [(state.values, state.name, state.desc) for state in states],
+        'edges': [(number[id(edge['source'])], number[id(edge['target'])],
+                   edge['explanation'], edge['transition']) for edge in edges],
+    }
+
+
+class Envisionment(object):
+    # states and edges of one model with the indexes used by queries
+    def __init__(self, key, graph):
+        self.key = key
+        space = StateSpace(graph['quantities'], graph['models'])
+        self.states = []
+        for values, name, desc in graph['states']:
+            state = State(space, tuple(values))
+            state.name, state.desc = name, desc
+            self.states.append(state)
+        self.edges = []
+        self.outgoing = collections.defaultdict(list)
+        self.incoming = collections.defaultdict(list)
+        for src, tgt, desc, transition in graph['edges']:
+            source, target = self.states[src], self.states[tgt]
+            source.next_states.append(target)
+            edge = {"explanation": desc, "source": source, "target": target,
+                    "transition": transition}
+            self.edges.append(edge)
+            self.outgoing[source.name].append(edge)
+            self.incoming[target.name].append(edge)
+        self.by_name = {state.name: state for state in self.states}
+        self.index = GraphIndex(self.states)
+
+    def state(self, name):
+        try:
+            return self.by_name[str(name)]
+        except KeyError:
+            raise ValueError("unknown state: " + str(name))
+
+    def successors(self, name):
+        return [{'target': edge['target'].name, 'desc': edge['explanation'],
+                 'transition': edge['transition']}
+                for edge in self.outgoing[self.state(name).name]]
+
+    def reachable(self, source, target):
+        return self.index.reachable(self.state(source), self.state(target))
+
+    def explain(self, source, target):
+        target = self.state(target).name
+        return [{'desc': edge['explanation'], 'explanation': decodeDesc(edge['explanation']),
+                 'transition': edge['transition']}
+                for edge in self.outgoing[self.state(source).name]
+                if edge['target'].name == target]
+
+    # DOT of the states at most radius edges away from the state in either direction
+    def subgraph(self, name, radius=1):
+        selected = {self.state(name).name}
+        frontier = list(selected)
+        for _ in range(radius):
+            neighbours = [edge['target'].name for st in frontier for edge in self.outgoing[st]]
+            neighbours += [edge['source'].name for st in frontier for edge in self.incoming[st]]
+            frontier = [st for st in neighbours if st not in selected]
+            selected.update(frontier)
+        states = [state for state in self.states if state.name in selected]
+        edges = [edge for st in selected for edge in self.outgoing[st]
+                 if edge['target'].name in selected]
+        out = io.StringIO()
+        writeGraph(states, edges, [DotWriter(out)])
+        return out.getvalue()
+
+
+class QueryService(object):
+    # max_models envisionments are kept in memory, workers is the size of the
+    # process pool which computes envisionments of models not in the cache and
+    # cache_dir an optional directory of envisionments kept between runs;
+    # clients may load .hgp files from hgp_dir and families up to max_size
+    def __init__(self, max_models=8, workers=None, executor=None, cache_dir=None,
+                 hgp_dir=None, max_size=MAX_FAMILY_SIZE):
+        self.max_models = max_models
+        self.cache_dir = cache_dir
+        self.hgp_dir = hgp_dir
+        self.max_size = max_size
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+        self.workers = workers
+        self.own_executor = executor is None
+        self.executor = executor if executor is not None else self.newExecutor()
+
+    # forked workers would inherit the sockets of connected clients
+    def newExecutor(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def envisionment(self, key):
+        graph = self.cache.get(key)
+        if graph is not None:
+            self.cache.move_to_end(key)
+            return graph
+        # concurrent requests of the same model wait for one computation
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.compute(key))
+            self.pending[key] = future
+        return await asyncio.shield(future)
+
+    async def compute(self, key):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                data = await loop.run_in_executor(self.executor, computeGraph, key, self.cache_dir)
+            except BrokenProcessPool:
+                # a crashed worker breaks the pool, later requests get a new one
+                if self.own_executor:
+                    self.executor.shutdown(wait=False)
+                    self.executor = self.newExecutor()
+                raise
+            graph = await loop.run_in_executor(None, Envisionment, key, data)
+        finally:
+            del self.pending[key]
+        self.cache[key] = graph
+        while len(self.cache) > self.max_models:
+            self.cache.popitem(last=False)
+        return graph
+
+    async def query(self, request):
+        op = request.get('op')
+        if op == 'models':
+            return list(self.cache)
+        key = request.get('model')
+        if not isinstance(key, str):
+            raise ValueError("model has to be a string: " + repr(key))
+        key = checkModel(key, self.hgp_dir, self.max_size)
+        graph = await self.envisionment(key)
+        if op == 'load':
+            return {'states': len(graph.states), 'edges': len(graph.edges)}
+        if op == 'successors':
+            return graph.successors(request['state'])
+        if op == 'reachable':
+            return graph.reachable(request['source'], request['target'])
+        if op == 'explain':
+            return graph.explain(request['source'], request['target'])
+        if op == 'subgraph':
+            return graph.subgraph(request['state'], int(request.get('radius', 1)))
+        raise ValueError("unknown op: " + str(op))
+
+    async def handle(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'error': 'invalid request: ' + str(error)}
+        if not isinstance(request, dict):
+            return {'error': 'invalid request: expected an object'}
+        # every request gets a response, errors of the query or of the worker
+        # pool are reported to the client instead of ending the connection
+        try:
+            return {'id': request.get('id'), 'result': await self.query(request)}
+        except Exception as error:
+            return {'id': request.get('id'), 'error': type(error).__name__ + ': ' + str(error)}
+
+    # requests of one client are answered concurrently and in any order
+    async def client(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def answer(line):
+            response = await self.handle(line)
+            async with lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        return await asyncio.start_server(self.client, host, port)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def serve(host, port, max_models, workers, cache_dir=None, hgp_dir=None,
+                max_size=MAX_FAMILY_SIZE):
+    service = QueryService(max_models, workers, cache_dir=cache_dir, hgp_dir=hgp_dir,
+                           max_size=max_size)
+    server = await service.start(host, port)
+    print("serving on %s:%d" % server.sockets[0].getsockname()[:2])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Query service over envisionments.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-models', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default='', metavar='DIR',
+                        help="reuse envisionments stored in this directory")
+    parser.add_argument('--hgp-dir', default='', metavar='DIR',
+                        help="serve the .hgp models in this directory")
+    parser.add_argument('--max-size', type=int, default=MAX_FAMILY_SIZE,
+                        help="largest number of containers of the synthetic models")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.max_models, args.workers, args.cache or None,
+                      args.hgp_dir or None, args.max_size))
+
+
+if __name__ == '__main__':
+    main()
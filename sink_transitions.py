@@ -1,103 +1,164 @@
-# implementation of pytransitions for the inflow-volume-outflow of a sink with water
-# link to pytransitionson github: https://github.com/pytransitions/transitions#quickstart
+# state machines of the inflow-volume-outflow of a sink with water, modelled
+# after pytransitions: https://github.com/pytransitions/transitions#quickstart
+# one transition table is shared by all quantities of the same quantity space
+# and the state of a quantity is the index of its state in the table
 
-from transitions import Machine
-import random
 
 derivative_states = ['negative', 'zero', 'positive'] # define all possible states for derivatives
 
-class InflowMagnitude(object):
-    
-    states = ['zero', 'positive'] # define all possible states for magnitude
-    
-    def __init__(self):
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=InflowMagnitude.states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        
-class InflowDerivative(object):
-    
-    def __init__(self):
+class MachineError(Exception):
+    pass
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=InflowDerivative.derivative_states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='negative', dest='zero')
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        self.machine.add_transition(trigger='decrease', source='zero', dest='negative')
-     
-        
-class VolumeMagnitude(object):
-    
-    states = ['zero', 'positive', 'maximum'] # define all possible states for magnitude
-    
-    def __init__(self):
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=VolumeMagnitude.states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='increase', source='positive', dest='maximum')
-        self.machine.add_transition(trigger='decrease', source='maximum', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        
-class VolumeDerivative(object):
-    
-    def __init__(self):
+class FsmTable(object):
+    # transitions are (trigger, source, dest), next_state[trigger][source]
+    # is the index of dest or -1 when the trigger is not allowed
+    def __init__(self, states, transitions):
+        self.states = list(states)
+        self.index = {state: idx for idx, state in enumerate(self.states)}
+        self.triggers = []
+        self.next_state = {}
+        for trigger, source, dest in transitions:
+            if trigger not in self.next_state:
+                self.triggers.append(trigger)
+                self.next_state[trigger] = [-1] * len(self.states)
+            self.next_state[trigger][self.index[source]] = self.index[dest]
+        self.arrays = None
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=VolumeDerivative.derivative_states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='negative', dest='zero')
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        self.machine.add_transition(trigger='decrease', source='zero', dest='negative')
-        
+    # next states as numpy arrays for stepping batches
+    def nextArray(self, trigger):
+        if self.arrays is None:
+            import numpy as np
+            self.arrays = {trig: np.array(nxt, dtype=np.int8)
+                           for trig, nxt in self.next_state.items()}
+        return self.arrays[trigger]
 
-class OutflowMagnitude(object):
-    
-    states = ['zero', 'positive', 'maximum'] # define all possible states for magnitude
 
-    def __init__(self):
+MAGNITUDE_ZP = FsmTable(['zero', 'positive'], [
+    ('increase', 'zero', 'positive'),
+    ('decrease', 'positive', 'zero')])
+
+MAGNITUDE_ZPM = FsmTable(['zero', 'positive', 'maximum'], [
+    ('increase', 'zero', 'positive'),
+    ('increase', 'positive', 'maximum'),
+    ('decrease', 'maximum', 'positive'),
+    ('decrease', 'positive', 'zero')])
+
+DERIVATIVE = FsmTable(derivative_states, [
+    ('increase', 'negative', 'zero'),
+    ('increase', 'zero', 'positive'),
+    ('decrease', 'positive', 'zero'),
+    ('decrease', 'zero', 'negative')])
+
+
+class Quantity(object):
+    __slots__ = ('value',)
+    table = None
+    initial = 'zero'
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=OutflowMagnitude.states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='increase', source='positive', dest='maximum')
-        self.machine.add_transition(trigger='decrease', source='maximum', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        
-class OutflowDerivative(object):
-    
     def __init__(self):
+        self.value = self.table.index[self.initial]
+
+    @property
+    def state(self):
+        return self.table.states[self.value]
+
+    def trigger(self, name):
+        dest = self.table.next_state[name][self.value]
+        if dest < 0:
+            raise MachineError("Can't trigger event %s from state %s!" % (name, self.state))
+        self.value = dest
+        return True
+
+    def increase(self):
+        return self.trigger('increase')
+
+    def decrease(self):
+        return self.trigger('decrease')
+
+
+class InflowMagnitude(Quantity):
+    __slots__ = ()
+    states = MAGNITUDE_ZP.states # define all possible states for magnitude
+    table = MAGNITUDE_ZP
+
+
+class InflowDerivative(Quantity):
+    __slots__ = ()
+    states = derivative_states
+    table = DERIVATIVE
+
+
+class VolumeMagnitude(Quantity):
+    __slots__ = ()
+    states = MAGNITUDE_ZPM.states # define all possible states for magnitude
+    table = MAGNITUDE_ZPM
+
+
+class VolumeDerivative(Quantity):
+    __slots__ = ()
+    states = derivative_states
+    table = DERIVATIVE
+
+
+class OutflowMagnitude(Quantity):
+    __slots__ = ()
+    states = MAGNITUDE_ZPM.states # define all possible states for magnitude
+    table = MAGNITUDE_ZPM
+
+
+class OutflowDerivative(Quantity):
+    __slots__ = ()
+    states = derivative_states
+    table = DERIVATIVE
+
+
+class SinkBatch(object):
+    # states of many sinks, one int8 column for every quantity of a sink
+    quantities = [
+        ('inflow_mag', InflowMagnitude),
+        ('inflow_der', InflowDerivative),
+        ('volume_mag', VolumeMagnitude),
+        ('volume_der', VolumeDerivative),
+        ('outflow_mag', OutflowMagnitude),
+        ('outflow_der', OutflowDerivative),
+    ]
+
+    def __init__(self, size):
+        import numpy as np
+        self.column = {name: idx for idx, (name, _) in enumerate(self.quantities)}
+        initial = [cls.table.index[cls.initial] for _, cls in self.quantities]
+        self.values = np.tile(np.array(initial, dtype=np.int8), (size, 1))
+
+    def table(self, quantity):
+        return self.quantities[self.column[quantity]][1].table
+
+    # fires trigger on the quantity of the sinks selected by the boolean mask
+    # (all by default), sinks where it is not allowed keep their state;
+    # returns the mask of sinks which changed
+    def step(self, quantity, trigger, mask=None):
+        col = self.column[quantity]
+        dest = self.table(quantity).nextArray(trigger)[self.values[:, col]]
+        changed = dest >= 0
+        if mask is not None:
+            changed &= mask
+        self.values[changed, col] = dest[changed]
+        return changed
+
+    def states(self, quantity):
+        states = self.table(quantity).states
+        return [states[val] for val in self.values[:, self.column[quantity]]]
+
 
-        # initialize state machine
-        self.machine = Machine(model=self, states=OutflowDerivative.derivative_states, initial='zero')
-    
-        # add transitions
-        self.machine.add_transition(trigger='increase', source='negative', dest='zero')
-        self.machine.add_transition(trigger='increase', source='zero', dest='positive')
-        self.machine.add_transition(trigger='decrease', source='positive', dest='zero')
-        self.machine.add_transition(trigger='decrease', source='zero', dest='negative')
-  
-        
 # TEST
-print("Define inflow magnitude:")
-inflow = InflowMagnitude()
-print(inflow.state, "\n")
-print("Increase inflow magnitude:")
-inflow.increase()
-print(inflow.state, "\n")
-print("Decrease inflow magnitude:")
-inflow.decrease()
-print(inflow.state, "\n")
\ No newline at end of file
+if __name__ == '__main__':
+    print("Define inflow magnitude:")
+    inflow = InflowMagnitude()
+    print(inflow.state, "\n")
+    print("Increase inflow magnitude:")
+    inflow.increase()
+    print(inflow.state, "\n")
+    print("Decrease inflow magnitude:")
+    inflow.decrease()
+    print(inflow.state, "\n")
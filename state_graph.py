@@ -1,90 +1,8 @@
-import copy
+import contextlib
 import queue
-import pydot
 
-
-class NZP:
-    def __init__(self):
-        self.names = ['-', '0', '+']
-        self.vals = [-1, 0, 1]
-        self.stationary = [False, True, False]
-
-
-class ZP:
-    def __init__(self):
-        self.names = ['0', '+']
-        self.vals = [0, 1]
-        self.stationary = [True, False]
-
-
-class ZPM:
-    def __init__(self):
-        self.names = ['0', '+', 'm']
-        self.vals = [0, 1, 2]
-        self.stationary = [True, False, True]
-
-
-class QSpace(object):
-    def __init__(self, name, Qmodel, state):
-        self.name = name
-        self.q_model = Qmodel
-        self.current_state = state
-        self.maximum = len(self.q_model.vals)
-
-    def increase(self):
-        if self.current_state < self.maximum - 1:
-            self.current_state += 1
-
-    def decrease(self):
-        if self.current_state > 0:
-            self.current_state -= 1
-
-    def setStateAs(self, q_state):
-        # TODO add check if two states are the same
-        self.current_state = q_state.current_state
-
-    def getVal(self):
-        return self.q_model.vals[self.current_state]
-
-    def getName(self):
-        return self.q_model.names[self.current_state]
-
-    def isStationary(self):
-        return self.q_model.stationary[self.current_state]
-
-    def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return self.getVal() == other.getVal()
-        return False
-
-    def __ne__(self, other):
-        return not self.__eq__(other)
-
-
-class State:
-    def __init__(self, quantities):
-        self.state = {
-            'inflow': {'mag': quantities[0],
-                       'der': quantities[1]},
-            'volume': {'mag': quantities[2],
-                       'der': quantities[3]},
-            'outflow': {'mag': quantities[4],
-                        'der': quantities[5]}
-        }
-        self.next_states = []
-        self.quantities = quantities
-        self.name = "0"
-        self.desc =""
-
-    def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            for idx in range(len(self.quantities)):
-                if self.quantities[idx] != other.quantities[idx]:
-                    return False
-        return True
-
-    def __ne__(self, other):
-        return not self.__eq__(other)
+from bathtub import bathtubModel
+from qr_model import NZP, ZP, ZPM, QSpace, State
 
 
 class StateChange:
@@ -93,159 +11,32 @@ class StateChange:
 
 
 def stationaryToIntervalChange(state_obj):
-    for qt in state_obj.quantities:
-        if qt.isStationary():
+    for quantity, part in state_obj.space.quantities:
+        if state_obj.isStationary(quantity, part):
             return True
     return False
 
 
-def genFlipedInflow(state_obj):
-    states = []
-    if state_obj.state['inflow']['der'].getVal() == 0:
-        states.append(newState(state_obj,[('inflow','der',+1)], 
-            desc="Id+", transition="increase"))
-        
-        if state_obj.state['inflow']['mag'].getVal() != 0:
-            states.append(newState(state_obj,[('inflow','der',-1)], 
-                desc="Id-", transition="decrease"))                     
-
-        return states
-
-    if (state_obj.state['inflow']['mag'].getVal() == 0
-        and state_obj.state['inflow']['der'].getVal() == 1):
-        return states
-    if (state_obj.state['inflow']['mag'].getVal() == 1
-        and state_obj.state['outflow']['der'].getVal() == 0
-        and state_obj.state['outflow']['mag'].getVal() != 2):
-        return states
-    if (state_obj.state['inflow']['der'].getVal() == -1
-        and state_obj.state['outflow']['mag'].getVal() == 2):
-        return states
-    if state_obj.state['inflow']['der'].getVal() == -1:
-        states.append(newState(state_obj,[('inflow','der',+1)],
-            desc="Id+", transition="increase"))
-        return states
-    if state_obj.state['inflow']['der'].getVal() == 1:
-        states.append(newState(state_obj,[('inflow','der',-1)],
-            desc="Id-", transition="decrease"))        
-        return states
-    return states
-
-
-def newState(state_obj,change =[('inflow','der',0)],desc="", transition=""):
-    new_state = copy.deepcopy(state_obj)
-    for ch in change:
-        if ch[2] == -1:
-            new_state.state[ch[0]][ch[1]].decrease()
-        elif ch[2] == 1:
-            new_state.state[ch[0]][ch[1]].increase()
-
-    return {'state': new_state, 'desc':desc, 'transition': transition}
-
-
-def generateNextStates(state_obj):
-    state = state_obj.state
+# successors are looked up in the transition table compiled from the model
+def generateNextStates(state_obj, table):
     new_states = []
-    # imidiate changes
-    if state['outflow']['mag'].getVal() == 0 and state['outflow']['der'].getVal() == 1:
-         new_states.append(newState(state_obj,[('volume','mag',1),('outflow','mag',1)],
-             desc="Im+->Vd+,Od+", transition="time"))
-         #new_states[-1]['state'].desc="Positive change in volume/outflow causes increase in magnitude of these quantities."
-
-    if state['inflow']['mag'].getVal() == 0 and state['inflow']['der'].getVal() == 1:
-         changes = [('inflow','mag',1)]
-         desc = "Id+->Im+. "
-         state_desc = "Positive change in inflow increases magnitude of inflow."
-         if state['outflow']['der'].isStationary():
-            changes.append(('outflow','der',1))
-            changes.append(('volume','der',1))
-            state_desc+=" Positive change in inflow magnitude causes to positively increase change of volume and outflow."
-         new_states.append(newState(state_obj,changes, desc=desc+"Im+->Vd+,Od+", transition="time"))
-         new_states[-1]['state'].desc=state_desc
-
-    if len(new_states) == 0:
-        new_states = new_states + genFlipedInflow(state_obj)
-    # Changes which take long time:
-
-    # increasing inflow volume
-    if (state['inflow']['mag'].getVal() == 1 and state['inflow']['der'].getVal() == 1):
-        # apply positive Infuence
-        if state['outflow']['mag'].getVal() != 2:
-            new_states.append(newState(state_obj,[('volume','der',+1),('outflow','der',+1)],
-                desc="E+->Vd+,Od+", transition="time"))
-            new_states[-1]['state'].desc="Increasing inflow. Increasing derivation of Volume and Outflow."
-        if state['outflow']['mag'].getVal() == 1 and state['outflow']['der'].getVal() == 1:
-            # go to maximal state
-            new_states.append(newState(state_obj,[('volume','mag',1),
-                ('volume','der',-1),('outflow','mag',1),('outflow','der',-1)],
-                desc="E+->Om+", transition="time"))
-            new_states[-1]['state'].desc="Increasing inflow. Maximal capacity of container reached."
-
-        # rate of changes between inflow and outflow- outflow is faster -> go back to steady
-        if (state['outflow']['mag'].getVal() == 1
-            and state['outflow']['der'].getVal() == state['inflow']['der'].getVal()):
-            new_states.append(newState(state_obj,[('volume','der',-1),('outflow','der',-1)],
-                desc="Im<Om->Vd-,Od-", transition="time"))
-            new_states[-1]['state'].desc="Increasing inflow. Inflow is increasing slower than Outflow. The volume is in positive steady state."
-
-    # steady inflow volume
-    if (state['inflow']['mag'].getVal() == 1 and state['inflow']['der'].getVal() == 0):
-        change = -1*  state['outflow']['der'].getVal()
-        s = '+' if change >0 else '-' if change < 0 else '~'
-        new_states.append(newState(state_obj,
-            [('volume','der',change),('outflow','der',change)],
-            desc="E~->Vd"+s+',Od'+s))
-        new_states[-1]['state'].desc="Positive steady inflow."
-        if state['outflow']['der'].getVal() == 1:
-            new_states.append(newState(state_obj,[('volume','mag',1),
-                ('volume','der',-1),('outflow','mag',1),('outflow','der',-1)],
-                desc="E~->Vm+,Om+", transition="time"))
-            new_states[-1]['state'].desc="Positive steady inflow. Maximal capacity of container reached."
-
-    # decreasing inflow volume
-    if (state['inflow']['mag'].getVal() == 1 and state['inflow']['der'].getVal() == -1):
-        # apply negative influence
-        new_states.append(newState(state_obj,[('volume','der',-1),('outflow','der',-1)],
-            desc="E-->Vd-,Od-", transition="time"))
-        # extreme no inflow volume left
-        if state['outflow']['der'].getVal() == -1 and state['outflow']['mag'].getVal() < 2:
-            new_states.append(newState(state_obj,[('inflow','der',+1),('inflow','mag',-1)],
-                desc="E-->Id0,Im0", transition="time"))
-            new_states[-1]['state'].desc="Inflow is empty."
-        # colapsing from maximum to plus
-        if state['outflow']['mag'].getVal() == 2 and state['outflow']['der'].getVal() == -1:
-            new_states.append(newState(state_obj,[('volume','mag',-1),('outflow','mag',-1)],
-                desc="E-->Vm-,Om-", transition="time"))
-            new_states[-1]['state'].desc="Inflow is is slowing down what causes increase in outflow rate."
-        # speed of decrease can be different in inflow and outflow -> go to steady outflow
-        if (state['outflow']['der'].getVal() == state['inflow']['der'].getVal()
-            and not state['outflow']['mag'].isStationary()):
-            new_states.append(newState(state_obj,[('volume','der',+1),('outflow','der',+1)],
-                desc="E-->Vd-,Od-", transition="time"))
-            new_states[-1]['state'].desc="Positive steady state"
-
-    # no inflow volume
-    if (state['inflow']['mag'].getVal() == 0 and state['inflow']['der'].getVal() == 0):
-        if state['outflow']['mag'].getVal() > 0:
-            new_states.append(newState(state_obj,
-                [('volume','der',-1),('outflow','der',-1)],
-                desc="E0->Vd-,Od-", transition="time"))
-
-        if (state['outflow']['mag'].getVal() == 1 and state['outflow']['der'].getVal() == -1):
-            new_states.append(newState(state_obj,[('volume','der',1),('outflow','der',1),
-                ('volume','mag',-1),('outflow','mag',-1)], 
-                desc="E0->Vd+,Od+", transition="time"))
-                
-    # print('new states generated: ',len(new_states))
+    for values, rule in table.successors(state_obj.values):
+        new_state = State(state_obj.space, values)
+        new_state.desc = state_obj.desc if rule.note is None else rule.note
+        new_states.append({'state': new_state, 'desc': rule.desc,
+                           'transition': rule.transition})
     return new_states
 
 
+# names of the quantities in the order of the model
+def quantityNames(state_obj):
+    return [quantity for quantity, part in state_obj.space.quantities if part == 'mag']
+
+
 def printState(state_obj):
-    state = state_obj.state
     print("State",state_obj.name)
-    print(state['inflow']['mag'].getName(), state['inflow']['der'].getName())
-    print(state['volume']['mag'].getName(), state['volume']['der'].getName())
-    print(state['outflow']['mag'].getName(), state['outflow']['der'].getName())
+    for quantity in quantityNames(state_obj):
+        print(state_obj.getName(quantity, 'mag'), state_obj.getName(quantity, 'der'))
     print('----------------------')
 
 
@@ -253,34 +44,60 @@ def createEdge(source, target, desc, transition):
     return {"explanation": desc,"source": source, "target": target, "transition": transition}
 
 
-def addNewState(edges, states, source, target, desc, transition):
+def addNewState(edges, states, source, target, desc, transition, index=None):
     source.next_states.append(target)
     edges.append(createEdge(source,target,desc,transition))
     states.append(target)
+    if index is not None:
+        index[target.key()] = target
     return edges, states
 
 
-def existingState(states, state):
-    for s in states:
-        if s == state:
-            return s
-    return None
+# index maps the state key to already discovered state
+def existingState(index, state):
+    return index.get(state.key())
 
 
 #------------------------------------ VISUALIZATION -------------------------------
 # returns the values for all variables in text format
 def getStateText(state):
-    in_mag = state.state['inflow']['mag'].getName()
-    in_der = state.state['inflow']['der'].getName()
-    vol_mag = state.state['volume']['mag'].getName()
-    vol_der = state.state['volume']['der'].getName()
-    out_mag = state.state['outflow']['mag'].getName()
-    out_der = state.state['outflow']['der'].getName()
-    return str(state.name)+'\n'+in_mag+"  "+in_der+"\n"+vol_mag+"  "+vol_der+"\n"+out_mag+"  "+out_der
-
-
-# generates a visual (directed) graph of all states
-def generateGraph(edgeList):
+    text = str(state.name)
+    for quantity in quantityNames(state):
+        text += '\n' + state.getName(quantity, 'mag') + "  " + state.getName(quantity, 'der')
+    return text
+
+
+# returns cached text of the state, labels maps state key to its text
+def getCachedStateText(labels, state):
+    text = labels.get(state.key())
+    if text is None:
+        text = getStateText(state)
+        labels[state.key()] = text
+    return text
+
+
+# color of the edge for type of transition (increase, decrease or time)
+def edgeColor(transitionType):
+    if transitionType == "increase":
+        return '#00FF00'
+    elif transitionType == "decrease":
+        return '#FF0000'
+    return '#black'
+
+
+# fill color and border of the node, terminal states are highlighted
+def nodeStyle(terminal):
+    if terminal:
+        return '#81B2E0', 2.8
+    return '#92E0DF', 1.5
+
+
+# generates a visual (directed) graph of all states, should be called once
+# the exploration is finished so that terminal states are known
+def generateGraph(edgeList, labels=None):
+    import pydot
+    if labels is None:
+        labels = {}
     graph = pydot.Dot(graph_type='digraph', center=True, size=15)
     for edgeObj in edgeList:
         transitionText = edgeObj['explanation'] # explanation for transition
@@ -288,22 +105,12 @@ def generateGraph(edgeList):
         sourceState = edgeObj['source']         # source state (obj)
         targetState = edgeObj['target']         # target state (obj)
 
-        if transitionType == "increase":
-            edgeFillColor = '#00FF00'
-        elif transitionType == "decrease":
-            edgeFillColor = '#FF0000'
-        else:
-            edgeFillColor = '#black'
+        edgeFillColor = edgeColor(transitionType)
 
-        sourceStateText = getStateText(sourceState) # all values of source state in text format
-        targetStateText = getStateText(targetState) # all values of target state in text format
+        sourceStateText = getCachedStateText(labels, sourceState) # all values of source state in text format
+        targetStateText = getCachedStateText(labels, targetState) # all values of target state in text format
 
-        if len(targetState.next_states) == 0:
-            nodeFillColor = '#81B2E0'
-            nodeBorder = 2.8
-        else:
-            nodeFillColor = '#92E0DF'
-            nodeBorder = 1.5
+        nodeFillColor, nodeBorder = nodeStyle(len(targetState.next_states) == 0)
 
         sourceNode = pydot.Node(sourceStateText, shape='rectangle',
             style="filled", fillcolor='#92E0DF', penwidth=1.5)
@@ -342,37 +149,36 @@ def decodeDesc(desc):
     
     
 def printIntraState(state_obj):
-    state = state_obj.state
     printState(state_obj)
     print(state_obj.desc)
     for var in ['inflow', 'outflow', 'volume']:
-        if state[var]['der'].getVal() == 1 and state[var]['mag'].getVal() == 1:
+        if state_obj.getVal(var, 'der') == 1 and state_obj.getVal(var, 'mag') == 1:
             print(var+ ' quantity increasing')
-        if state[var]['der'].getVal() == 0 and state[var]['mag'].getVal() == 1:
+        if state_obj.getVal(var, 'der') == 0 and state_obj.getVal(var, 'mag') == 1:
             print(var+ ' quantity is steady')
-        if state[var]['der'].getVal() == -1 and state[var]['mag'].getVal() == 1:
+        if state_obj.getVal(var, 'der') == -1 and state_obj.getVal(var, 'mag') == 1:
             print(var+ ' quantity decreasing')
     '''        
     if state_obj.desc == None or state_obj.desc == '':
-        if state['inflow']['der'].getVal() == 0:
+        if state_obj.getVal('inflow', 'der') == 0:
             print("Initial state. Inflow is empty.")
-        if state['inflow']['der'].getVal() == 1:
+        if state_obj.getVal('inflow', 'der') == 1:
             print("Increasing inflow.")
-    if state['volume']['der'].getVal() == -1:
+    if state_obj.getVal('volume', 'der') == -1:
         print('Decreasing volume / outflow.')
-    if state['volume']['der'].getVal() == 1:
+    if state_obj.getVal('volume', 'der') == 1:
         print('Increasing volume / outflow.')
-    if state['volume']['der'].getVal() == 0:
+    if state_obj.getVal('volume', 'der') == 0:
         print('Steady volume / outflow.')
-    # if state['inflow']['der'].getVal() == 1:
+    # if state_obj.getVal('inflow', 'der') == 1:
     #     print('Inflow is increasing')
-    # if state['inflow']['der'].getVal() == -1:
+    # if state_obj.getVal('inflow', 'der') == -1:
     #     print('Inflow is decreasing')
-    # if state['inflow']['der'].getVal() == 0 and state['inflow']['mag'].getVal() == 0:
+    # if state_obj.getVal('inflow', 'der') == 0 and state_obj.getVal('inflow', 'mag') == 0:
     #     print('Inflow is positive without change')
-    # if state['outflow']['mag'].getVal() == 2:
+    # if state_obj.getVal('outflow', 'mag') == 2:
     #     print('Container is full.')
-    # if state['outflow']['der'].getVal() == 1:
+    # if state_obj.getVal('outflow', 'der') == 1:
     #     print('')
     '''
     print('----------------------')
@@ -380,54 +186,233 @@ def printIntraState(state_obj):
 
 def printInterstate(name_a,name_b,desc):
     print("{:<3}->{:<3}:{:<30}{:<100}".format(name_a,name_b,desc,decodeDesc(desc)))
+
+
+# breadth first search over all states reachable from the initial state,
+# profiler is an optional profiling.Profiler
+def envision(initial_state, table, trace=False, profiler=None):
+    states = [initial_state]
+    state_index = {initial_state.key(): initial_state}
+    edges = []
+    fringe = queue.Queue()
+    fringe.put(initial_state)
+
+    while not fringe.empty():
+        curr_state = fringe.get(block=False)
+        if profiler is None:
+            new_states = generateNextStates(curr_state, table)
+        else:
+            start = profiler.clock()
+            new_states = generateNextStates(curr_state, table)
+            profiler.addTime('successors', start)
+            profiler.rulesFired(new_states)
+        for state_dict in new_states:
+            if profiler is None:
+                same_state = existingState(state_index, state_dict['state'])
+            else:
+                start = profiler.clock()
+                same_state = existingState(state_index, state_dict['state'])
+                profiler.addTime('dedup', start)
+                profiler.stateFound(same_state is None)
+            if same_state is None:
+                state_dict['state'].name = str(len(states))
+                edges, states = addNewState(edges, states,
+                                source=curr_state, target=state_dict['state'],
+                                desc=state_dict['desc'],transition=state_dict['transition'],
+                                index=state_index)
+                fringe.put(state_dict['state'])
+                if trace:
+                    printInterstate(curr_state.name,state_dict['state'].name,state_dict['desc'])
+            elif curr_state != same_state:
+                curr_state.next_states.append(same_state)
+                edges.append(createEdge(source=curr_state, target=same_state,
+                                        desc=state_dict['desc'], transition=state_dict['transition']))
+                if trace:
+                    printInterstate(curr_state.name,same_state.name,state_dict['desc'])
+    return states, edges
+
+
+# envisionment of the model with one of the engines: bfs, vector (needs numpy)
+# or parallel; initial_state defaults to all quantities being zero
+def explore(model, initial_state=None, engine='bfs', workers=None, trace=False,
+            profiler=None):
+    if initial_state is None:
+        initial_state = model.zeroState()
+    if engine == 'bfs':
+        return envision(initial_state, model.compile(), trace=trace, profiler=profiler)
+    if engine == 'vector':
+        from vector_envision import envisionVectorized
+        return envisionVectorized(initial_state, model.compile(), profiler=profiler)
+    if engine == 'parallel':
+        from parallel_envision import envisionParallel
+        return envisionParallel(initial_state, model, workers=workers, profiler=profiler)
+    raise ValueError("unknown engine: " + str(engine))
+
+
+def bathtubInitialState(model):
+    inflow_mag = QSpace('inflow_mag', ZP(), 0)
+    inflow_der = QSpace('inflow_der', NZP(), 1)
+    volume_mag = QSpace('volume_mag', ZPM(), 0)
+    volume_der = QSpace('volume_der', NZP(), 1)
+    outflow_mag = QSpace('outflow_mag', ZPM(), 0)
+    outflow_der = QSpace('outflow_der', NZP(), 1)
+
+    return model.initialState(
+        [inflow_mag, inflow_der,
+         volume_mag, volume_der,
+         outflow_mag, outflow_der])
+
+
 # --------------------------------------- MAIN --------------------------------------
-inflow_mag = QSpace('inflow_mag', ZP(), 0)
-inflow_der = QSpace('inflow_der', NZP(), 1)
-volume_mag = QSpace('volume_mag', ZPM(), 0)
-volume_der = QSpace('volume_der', NZP(), 1)
-outflow_mag = QSpace('outflow_mag', ZPM(), 0)
-outflow_der = QSpace('outflow_der', NZP(), 1)
-
-initial_state = State(
-    [inflow_mag, inflow_der,
-     volume_mag, volume_der,
-     outflow_mag, outflow_der])
-
-states = [initial_state]
-edges = []
-fringe = queue.Queue()
-fringe.put(initial_state)
-iteration = 0
-
-print("INTER-STATE TRACE")
-dot_graph = None
-while not fringe.empty():
-    curr_state = fringe.get(block=False)
-    new_states = generateNextStates(curr_state)
-    for state_dict in new_states:
-        same_state = existingState(states, state_dict['state'])
-        if same_state is None:
-            state_dict['state'].name = str(len(states))
-            edges, states = addNewState(edges, states,
-                            source=curr_state, target=state_dict['state'],
-                            desc=state_dict['desc'],transition=state_dict['transition'])
-            fringe.put(state_dict['state'])
-            printInterstate(curr_state.name,state_dict['state'].name,state_dict['desc'])
-        elif curr_state != same_state:
-            curr_state.next_states.append(same_state)
-            edges.append(createEdge(source=curr_state, target=same_state,
-                                    desc=state_dict['desc'], transition=state_dict['transition']))
-            printInterstate(curr_state.name,same_state.name,state_dict['desc'])
-
-    dot_graph = generateGraph(edges)
-    iteration+=1
-
-    # print('************'+str(iteration)+'*****************')
-    # input("Press Enter to continue...")
-dot_graph.write('graph.dot')
-dot_graph.write_png('TEST_graph.png')
-print("\n")
-print("INTRA-STATE TRACE")
-for st in states:
-    printIntraState(st)
-print("\n")
+@contextlib.contextmanager
+def nullPhase(name):
+    yield
+
+
+# (quantity, part) references of --collapse, the part defaults to mag
+def collapseRefs(text):
+    return [tuple((ref + ':mag').split(':')[:2]) for ref in text.split(',')]
+
+
+# level of detail rendering of the graph selected by the command line options
+def summaryDot(states, edges, args):
+    import io
+    from graph_summary import (capGraph, componentKey, neighbourhood, stateKey,
+                               summarize, valueKey, writeSummary)
+    start = states[0]
+    if args.focus:
+        start = next(state for state in states if state.name == args.focus)
+        states, edges = neighbourhood(states, edges, start, args.radius)
+    if args.collapse == 'scc':
+        key = componentKey(states)
+    elif args.collapse:
+        key = valueKey(*collapseRefs(args.collapse))
+    else:
+        key = stateKey
+    summary = summarize(states, edges, key)
+    capGraph(summary, args.max_nodes, args.max_edges, start=key(start))
+    out = io.StringIO()
+    writeSummary(summary, out)
+    return out.getvalue()
+
+
+def streamOutputs(initial_state, model, args, phase):
+    from graph_writer import DotWriter, JsonlWriter, streamEnvision
+    with contextlib.ExitStack() as stack:
+        writers = []
+        if args.dot:
+            writers.append(DotWriter(stack.enter_context(open(args.dot, 'w'))))
+        if args.jsonl:
+            writers.append(JsonlWriter(stack.enter_context(open(args.jsonl, 'w'))))
+        with phase('envision'):
+            streamEnvision(initial_state, model.compile(), writers)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Envisionment of the bathtub model.")
+    parser.add_argument('--engine', default='bfs', choices=['bfs', 'vector', 'parallel'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dot', default='graph.dot', help="pydot output, empty to skip")
+    parser.add_argument('--png', default='TEST_graph.png', help="rendered graph, empty to skip")
+    parser.add_argument('--collapse', default='',
+                        help="summary nodes: scc or quantities like volume:mag,inflow:der")
+    parser.add_argument('--focus', default='', help="render the neighbourhood of this state")
+    parser.add_argument('--radius', type=int, default=2)
+    parser.add_argument('--max-nodes', type=int, default=None)
+    parser.add_argument('--max-edges', type=int, default=None)
+    parser.add_argument('--jsonl', default='', help="JSON Lines export of the graph")
+    parser.add_argument('--csr', default='', help="CSR adjacency arrays as .npz")
+    parser.add_argument('--quiet', action='store_true', help="do not print the traces")
+    parser.add_argument('--profile', default='', help="JSON report of rules and phases")
+    parser.add_argument('--trace-events', default='', help="phases in chrome trace format")
+    parser.add_argument('--cache', default='', metavar='DIR',
+                        help="reuse envisionments stored in this directory")
+    args = parser.parse_args(argv)
+
+    profiler = None
+    if args.profile or args.trace_events:
+        from profiling import Profiler
+        profiler = Profiler()
+    phase = profiler.phase if profiler is not None else nullPhase
+
+    model = bathtubModel()
+    initial_state = bathtubInitialState(model)
+    if args.collapse and args.collapse != 'scc':
+        unknown = [':'.join(ref) for ref in collapseRefs(args.collapse)
+                   if ref not in model.quantities]
+        if unknown:
+            parser.error("unknown quantity in --collapse: " + ', '.join(unknown))
+
+    # DOT and JSON Lines are written during the search when nothing else needs
+    # the states in memory
+    summary = (args.collapse or args.focus or args.max_nodes is not None
+               or args.max_edges is not None)
+    if (args.engine == 'bfs' and args.quiet and not (summary or args.png or args.csr)
+            and not (args.cache or args.profile)):
+        streamOutputs(initial_state, model, args, phase)
+        if args.trace_events:
+            profiler.writeTrace(args.trace_events)
+        return
+
+    if not args.quiet:
+        print("INTER-STATE TRACE")
+    # the trace is printed while searching, a cached graph is printed afterwards
+    trace = not args.quiet and args.engine == 'bfs' and not args.cache
+    with phase('envision'):
+        if args.cache:
+            from envision_cache import EnvisionCache
+            states, edges = EnvisionCache(args.cache).envision(
+                model, initial_state,
+                explore=lambda initial, model: explore(model, initial, engine=args.engine,
+                                                       workers=args.workers, profiler=profiler))
+        else:
+            states, edges = explore(model, initial_state, engine=args.engine, workers=args.workers,
+                                    trace=trace, profiler=profiler)
+    if args.focus and not any(state.name == args.focus for state in states):
+        parser.error("unknown state in --focus: " + args.focus)
+    if not args.quiet and not trace:
+        for edge in edges:
+            printInterstate(edge['source'].name, edge['target'].name, edge['explanation'])
+
+    if (args.dot or args.png) and summary:
+        with phase('graph'):
+            dot_text = summaryDot(states, edges, args)
+        with phase('export'):
+            if args.dot:
+                with open(args.dot, 'w') as out:
+                    out.write(dot_text)
+            if args.png:
+                import pydot
+                pydot.graph_from_dot_data(dot_text)[0].write_png(args.png)
+    elif args.dot or args.png:
+        with phase('graph'):
+            dot_graph = generateGraph(edges)
+        with phase('export'):
+            if args.dot:
+                dot_graph.write(args.dot)
+            if args.png:
+                dot_graph.write_png(args.png)
+    if args.jsonl:
+        from graph_writer import JsonlWriter, writeGraph
+        with phase('export'), open(args.jsonl, 'w') as out:
+            writeGraph(states, edges, [JsonlWriter(out)])
+    if args.csr:
+        from csr_graph import CsrGraph
+        with phase('export'):
+            CsrGraph.fromEdges(states, edges).save(args.csr)
+
+    if not args.quiet:
+        print("\n")
+        print("INTRA-STATE TRACE")
+        for st in states:
+            printIntraState(st)
+        print("\n")
+    if args.profile:
+        profiler.writeReport(args.profile)
+    if args.trace_events:
+        profiler.writeTrace(args.trace_events)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# monte carlo sampling of behaviour traces, walkers are advanced together
+# over the CSR arrays of csr_graph and statistics are aggregated per batch
+import collections
+
+import numpy as np
+
+from csr_graph import EDGE_TYPES
+
+
+class PathStatistics(object):
+    # counts of sampled traces, only the counts are kept and not the traces
+    def __init__(self, num_states, num_edges, keep_paths=True):
+        self.walkers = 0
+        self.lengths = np.zeros(0, dtype=np.int64)
+        self.visits = np.zeros(num_states, dtype=np.int64)
+        self.end_states = np.zeros(num_states, dtype=np.int64)
+        self.edge_counts = np.zeros(num_edges, dtype=np.int64)
+        self.reached_goal = 0
+        self.paths = collections.Counter() if keep_paths else None
+
+    # paths is a (walkers, steps + 1) matrix of states padded with -1, edges
+    # is the matching matrix of taken edges
+    def update(self, paths, edges, lengths, reached):
+        self.walkers += len(paths)
+        self.reached_goal += int(reached.sum())
+        counts = np.bincount(lengths)
+        if len(counts) > len(self.lengths):
+            counts[:len(self.lengths)] += self.lengths
+            self.lengths = counts
+        else:
+            self.lengths[:len(counts)] += counts
+        self.visits += np.bincount(paths[paths >= 0], minlength=len(self.visits))
+        self.end_states += np.bincount(paths[np.arange(len(paths)), lengths],
+                                       minlength=len(self.end_states))
+        self.edge_counts += np.bincount(edges[edges >= 0], minlength=len(self.edge_counts))
+        if self.paths is not None:
+            unique, counts = np.unique(paths, axis=0, return_counts=True)
+            for path, count in zip(unique, counts):
+                self.paths[tuple(path[path >= 0].tolist())] += int(count)
+
+    def mostCommon(self, n=10):
+        if self.paths is None:
+            return []
+        return [(list(path), count / self.walkers) for path, count in self.paths.most_common(n)]
+
+    def report(self, names=None, n=10):
+        def name(state):
+            return state if names is None else names[state]
+        lengths = np.arange(len(self.lengths))
+        return {
+            'walkers': self.walkers,
+            'reached_goal': self.reached_goal,
+            'mean_length': float((lengths * self.lengths).sum() / max(self.walkers, 1)),
+            'end_states': {name(int(st)): int(self.end_states[st])
+                           for st in np.flatnonzero(self.end_states)},
+            'paths': [([name(st) for st in path], freq) for path, freq in self.mostCommon(n)],
+        }
+
+
+class TraceSampler(object):
+    # weights maps the transition type of an edge to its relative weight,
+    # types which are not given have weight 1
+    def __init__(self, graph, weights=None, seed=None):
+        self.graph = graph
+        self.rng = np.random.default_rng(seed)
+        type_weights = np.ones(len(EDGE_TYPES))
+        for transition, weight in (weights or {}).items():
+            type_weights[EDGE_TYPES.index(transition)] = weight
+        edge_weights = type_weights[graph.edge_type]
+
+        # cumulative edge weights normalised per state, the edge of a walker is
+        # the number of cumulative weights of its state below a uniform draw
+        sources = graph.sources()
+        totals = np.bincount(sources, weights=edge_weights, minlength=graph.num_states)
+        cumulative = np.cumsum(edge_weights)
+        start = np.concatenate([[0.0], cumulative])[graph.indptr[:-1]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            within = (cumulative - start[sources]) / totals[sources]
+        degree = graph.outDegree()
+        within[graph.indptr[1:][degree > 0] - 1] = 1.0
+        self.within = np.nan_to_num(within, nan=1.0)
+        self.offsets = np.arange(max(int(degree.max(initial=0)), 1))
+        self.degree = degree
+        # states without edges of positive weight end a trace
+        self.terminal = totals <= 0
+
+    # next edge of every walker at positions
+    def step(self, positions):
+        first = self.graph.indptr[positions]
+        degree = self.degree[positions]
+        edges = first[:, None] + np.minimum(self.offsets, degree[:, None] - 1)
+        draw = self.rng.random(len(positions))
+        return first + (self.within[edges] <= draw[:, None]).sum(axis=1)
+
+    # yields (paths, edges, lengths, reached) of batches of walkers started in
+    # start, walkers stop in states of the goal mask or in terminal states
+    def batches(self, start, walkers, max_steps=100, batch_size=4096, goal=None):
+        stop = self.terminal if goal is None else (self.terminal | goal)
+        for offset in range(0, walkers, batch_size):
+            size = min(batch_size, walkers - offset)
+            paths = np.full((size, max_steps + 1), -1, dtype=np.int32)
+            edges = np.full((size, max_steps), -1, dtype=np.int32)
+            lengths = np.zeros(size, dtype=np.int64)
+            positions = np.full(size, start, dtype=np.int32)
+            paths[:, 0] = start
+            active = np.flatnonzero(~stop[positions])
+            for step in range(max_steps):
+                if len(active) == 0:
+                    break
+                edge = self.step(positions[active])
+                positions[active] = self.graph.indices[edge]
+                paths[active, step + 1] = positions[active]
+                edges[active, step] = edge
+                lengths[active] = step + 1
+                active = active[~stop[positions[active]]]
+            reached = goal[positions] if goal is not None else self.terminal[positions]
+            yield paths, edges, lengths, reached
+
+    def sample(self, start, walkers, max_steps=100, batch_size=4096, goal=None,
+               keep_paths=True):
+        stats = PathStatistics(self.graph.num_states, len(self.graph.indices), keep_paths)
+        for batch in self.batches(start, walkers, max_steps, batch_size, goal):
+            stats.update(*batch)
+        return stats
@@ -0,0 +1,203 @@
+# level synchronous envisionment with numpy, rule conditions are evaluated as
+# boolean masks over all states of a breadth first frontier at once
+import numpy as np
+
+from qr_model import State
+from state_graph import createEdge
+
+# states are packed into int64 codes
+MAX_PRODUCT_SIZE = 1 << 62
+
+
+class ProductSpace(object):
+    # state values are encoded as mixed radix integers, the first quantity
+    # is the most significant digit
+    def __init__(self, space):
+        self.space = space
+        self.maximum = np.array(space.maximum, dtype=np.int64)
+        self.size = 1
+        for maximum in space.maximum:
+            self.size *= maximum
+        if self.size > MAX_PRODUCT_SIZE:
+            raise ValueError("product of quantity spaces has %d states, more than "
+                             "fit into int64 codes" % self.size)
+        self.stride = np.ones(len(space.maximum), dtype=np.int64)
+        for idx in range(len(space.maximum) - 2, -1, -1):
+            self.stride[idx] = self.stride[idx + 1] * self.maximum[idx + 1]
+
+    def encode(self, values):
+        return int(np.dot(np.asarray(values, dtype=np.int64), self.stride))
+
+    # values of the codes, one uint8 column for every quantity
+    def decode(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.empty(codes.shape + (len(self.stride),), dtype=np.uint8)
+        for pos, (stride, maximum) in enumerate(zip(self.stride, self.maximum)):
+            values[..., pos] = (codes // stride) % maximum
+        return values
+
+
+class TransitionMatrix(object):
+    # CSR adjacency of reachable states numbered in breadth first order,
+    # rule holds index into rules for every edge
+    def __init__(self, product, codes, indptr, indices, rule, rules):
+        self.product = product
+        self.codes = codes
+        self.indptr = indptr
+        self.indices = indices
+        self.rule = rule
+        self.rules = rules
+
+    # scipy is only needed when the matrix is requested in its format
+    def toSparse(self):
+        from scipy import sparse
+        size = len(self.codes)
+        return sparse.csr_matrix((self.rule + 1, self.indices, self.indptr),
+                                 shape=(size, size))
+
+
+class RuleMasks(object):
+    # lookup tables of the conditions of a compiled rule
+    def __init__(self, rule, maximum):
+        self.tests = []
+        for pos, allowed in rule.tests:
+            lookup = np.zeros(maximum[pos], dtype=bool)
+            lookup[list(allowed)] = True
+            self.tests.append((pos, lookup))
+        self.pair_tests = []
+        for pos, other, allowed in rule.pair_tests:
+            lookup = np.zeros((maximum[pos], maximum[other]), dtype=bool)
+            for i, j in allowed:
+                lookup[i, j] = True
+            self.pair_tests.append((pos, other, lookup))
+
+    def mask(self, values):
+        mask = np.ones(len(values), dtype=bool)
+        for pos, lookup in self.tests:
+            mask &= lookup[values[:, pos]]
+        for pos, other, lookup in self.pair_tests:
+            mask &= lookup[values[:, pos], values[:, other]]
+        return mask
+
+
+def ruleTargets(rule, codes, values, product):
+    targets = codes.copy()
+    for pos, direction in rule.delta:
+        val = values[:, pos].astype(np.int64) + direction
+        valid = (val >= 0) & (val < product.maximum[pos])
+        targets += np.where(valid, direction * product.stride[pos], 0)
+    return targets
+
+
+# successors of the codes of a frontier as (source position, target code, rule
+# index), edges of one source are ordered the same way as in TransitionTable.expand
+def frontierTransitions(table, product, masks, codes):
+    rules = table.ordered
+    values = product.decode(codes)
+    fired = np.array([masks[idx].mask(values) for idx in range(len(rules))],
+                     dtype=bool).reshape(len(rules), len(codes))
+    immediate = [idx for idx, rule in enumerate(rules) if rule.kind == 'immediate']
+    exogenous = [idx for idx, rule in enumerate(rules) if rule.kind == 'exogenous']
+    if immediate and exogenous:
+        fired[exogenous] &= ~fired[immediate].any(axis=0)
+
+    # transpose so that edges are grouped by source and ordered by rule
+    rule_idx, source = np.nonzero(fired)
+    order = np.lexsort((rule_idx, source))
+    rule_idx = rule_idx[order]
+    source = source[order]
+    targets = np.empty(len(source), dtype=np.int64)
+    for idx in np.unique(rule_idx):
+        selected = rule_idx == idx
+        targets[selected] = ruleTargets(rules[idx], codes[source[selected]],
+                                        values[source[selected]], product)
+    return source, targets, rule_idx
+
+
+# level synchronous breadth first search which only evaluates the rules on
+# reached states, numbering of states and order of edges is the same as in
+# state_graph.envision; profiler is an optional profiling.Profiler
+def reachableTransitions(table, initial_values, profiler=None):
+    product = ProductSpace(table.space)
+    maximum = [int(m) for m in product.maximum]
+    masks = [RuleMasks(rule, maximum) for rule in table.ordered]
+    start = product.encode(initial_values)
+    # codes of discovered states sorted for searchsorted, with their numbers
+    seen_codes = np.array([start], dtype=np.int64)
+    seen_numbers = np.array([0], dtype=np.int64)
+    frontier = seen_codes.copy()
+    frontier_numbers = seen_numbers.copy()
+    found = [frontier]
+    count = 1
+    sources, targets, edge_rules = [], [], []
+    while frontier.size:
+        if profiler is None:
+            src, tgt, rule = frontierTransitions(table, product, masks, frontier)
+        else:
+            start_time = profiler.clock()
+            src, tgt, rule = frontierTransitions(table, product, masks, frontier)
+            profiler.addTime('successors', start_time)
+            fired = np.bincount(rule, minlength=len(table.ordered))
+            for idx in np.flatnonzero(fired):
+                profiler.rule_counts[table.ordered[idx].desc] += int(fired[idx])
+            start_time = profiler.clock()
+            num_successors = len(tgt)
+        keep = tgt != frontier[src]
+        src, tgt, rule = src[keep], tgt[keep], rule[keep]
+        sources.append(frontier_numbers[src])
+
+        pos = np.searchsorted(seen_codes, tgt)
+        known = seen_codes[np.minimum(pos, len(seen_codes) - 1)] == tgt
+        unseen = tgt[~known]
+        first = np.sort(np.unique(unseen, return_index=True)[1])
+        frontier = unseen[first]
+        frontier_numbers = np.arange(count, count + frontier.size, dtype=np.int64)
+        count += frontier.size
+        found.append(frontier)
+
+        seen_codes = np.concatenate([seen_codes, frontier])
+        seen_numbers = np.concatenate([seen_numbers, frontier_numbers])
+        order = np.argsort(seen_codes, kind='stable')
+        seen_codes, seen_numbers = seen_codes[order], seen_numbers[order]
+        targets.append(seen_numbers[np.searchsorted(seen_codes, tgt)])
+        edge_rules.append(rule)
+        if profiler is not None:
+            profiler.addTime('dedup', start_time)
+            profiler.new_states += frontier.size
+            profiler.duplicate_states += num_successors - frontier.size
+
+    codes = np.concatenate(found)
+    source = np.concatenate(sources) if sources else np.zeros(0, dtype=np.int64)
+    target = np.concatenate(targets) if targets else np.zeros(0, dtype=np.int64)
+    rule = np.concatenate(edge_rules) if edge_rules else np.zeros(0, dtype=np.int64)
+    # sources are already sorted because frontiers are processed in order
+    row_ptr = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=len(codes)), out=row_ptr[1:])
+    return TransitionMatrix(product, codes, row_ptr, target, rule, table.ordered)
+
+
+# same result as state_graph.envision built from the transition matrix
+def envisionVectorized(initial_state, table, profiler=None):
+    matrix = reachableTransitions(table, initial_state.values, profiler)
+    values = matrix.product.decode(matrix.codes).tolist()
+    space = initial_state.space
+    states = [initial_state]
+    for idx in range(1, len(values)):
+        state = State(space, tuple(values[idx]))
+        state.name = str(idx)
+        states.append(state)
+
+    edges = []
+    discovered = [False] * len(states)
+    discovered[0] = True
+    sources = np.repeat(np.arange(len(states)), np.diff(matrix.indptr))
+    for src, tgt, rule_idx in zip(sources.tolist(), matrix.indices.tolist(),
+                                  matrix.rule.tolist()):
+        rule = matrix.rules[rule_idx]
+        source, target = states[src], states[tgt]
+        if not discovered[tgt]:
+            discovered[tgt] = True
+            target.desc = source.desc if rule.note is None else rule.note
+        source.next_states.append(target)
+        edges.append(createEdge(source, target, rule.desc, rule.transition))
+    return states, edges